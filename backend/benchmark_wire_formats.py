@@ -0,0 +1,126 @@
+"""Payload size and encode CPU per wire format for typical list responses.
+
+Usage: python benchmark_wire_formats.py [--rows 500] [--repeat 50]
+
+Encodes the same data the list endpoints return (rooms, tenants, canteen
+transactions) as JSON and MessagePack, each uncompressed, gzip and brotli,
+using the same encoders as ContentNegotiationMiddleware.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# server.py reads these at import time; no connection is made until a query runs
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import server
+
+FACILITIES = ["AC", "WiFi", "Kamar mandi dalam", "Kasur", "Lemari", "Meja belajar", "Water heater"]
+ROOM_TYPES = ["Standard", "Deluxe", "VIP"]
+NAMES = ["Budi Santoso", "Siti Rahayu", "Andi Wijaya", "Dewi Lestari", "Rizky Pratama", "Putri Ayu"]
+
+def make_rooms(rows: int, property_id: str):
+    return [
+        server.Room(
+            property_id=property_id,
+            room_number=f"{100 + i}",
+            room_type=random.choice(ROOM_TYPES),
+            price=random.choice([850000, 1200000, 1500000, 2000000]),
+            status=random.choice(["available", "occupied", "maintenance"]),
+            facilities=random.sample(FACILITIES, k=random.randint(2, 5)),
+        )
+        for i in range(rows)
+    ]
+
+def make_tenants(rows: int, property_id: str):
+    # Tenant fields beyond the model are what the tenants collection stores
+    tenants = []
+    for i in range(rows):
+        name = random.choice(NAMES)
+        tenants.append({
+            **server.Tenant(
+                property_id=property_id,
+                room_id=str(uuid.uuid4()),
+                full_name=name,
+                email=f"{name.split()[0].lower()}{i}@example.com",
+            ).model_dump(),
+            "phone": f"08{random.randint(100000000, 999999999)}",
+            "id_card_number": f"{random.randint(10**15, 10**16 - 1)}",
+            "check_in_date": datetime.now(timezone.utc) - timedelta(days=random.randint(1, 700)),
+            "payment_status": random.choice(["paid", "unpaid", "overdue"]),
+            "deposit_amount": 500000,
+        })
+    return tenants
+
+def make_transactions(rows: int, property_id: str):
+    return [
+        server.CanteenTransaction(
+            property_id=property_id,
+            product_id=str(uuid.uuid4()),
+            tenant_id=str(uuid.uuid4()),
+            quantity=random.randint(1, 4),
+            total_price=random.choice([5000, 12000, 15000, 25000]),
+            notes=random.choice([None, "Bayar tunai", "Masuk tagihan bulanan"]),
+        )
+        for _ in range(rows)
+    ]
+
+def timed(fn, repeat: int):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = fn()
+        samples.append(time.process_time() - start)
+    return result, statistics.median(samples) * 1000
+
+def benchmark(name: str, content, repeat: int):
+    encoders = {"json": lambda: JSONResponse(content).body}
+    if server.msgpack is not None:
+        encoders["msgpack"] = lambda: server.encode_msgpack(content)
+    encodings = ["identity", "gzip"] + (["br"] if server.brotli is not None else [])
+
+    rows = []
+    for format_name, encode in encoders.items():
+        body, encode_ms = timed(encode, repeat)
+        for encoding in encodings:
+            if encoding == "identity":
+                rows.append((name, format_name, encoding, len(body), encode_ms))
+                continue
+            compressed, compress_ms = timed(lambda: server.compress_body(body, encoding), repeat)
+            rows.append((name, format_name, encoding, len(compressed), encode_ms + compress_ms))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(42)
+    property_id = str(uuid.uuid4())
+    datasets = {
+        "rooms": make_rooms(args.rows, property_id),
+        "tenants": make_tenants(args.rows, property_id),
+        "canteen_transactions": make_transactions(args.rows, property_id),
+    }
+
+    print(f"{'dataset':<22}{'format':<10}{'encoding':<10}{'bytes':>10}{'ratio':>8}{'cpu ms':>10}")
+    for name, data in datasets.items():
+        # Same shape FastAPI hands to the response class after response_model validation
+        content = jsonable_encoder(data)
+        rows = benchmark(name, content, args.repeat)
+        baseline = rows[0][3]
+        for dataset, format_name, encoding, size, cpu_ms in rows:
+            print(f"{dataset:<22}{format_name:<10}{encoding:<10}{size:>10}{size / baseline:>8.2f}{cpu_ms:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Monthly financial report rendering.
+
+Runs inside the report process pool, so this module only depends on the
+rendering libraries and never on server.py (no database, no FastAPI).
+"""
+import os
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+SUMMARY_LABELS = [
+    ("rent_collected", "Sewa diterima"),
+    ("utility_charges", "Tagihan utilitas"),
+    ("canteen_revenue", "Pendapatan kantin"),
+    ("total_rooms", "Total kamar"),
+    ("occupied_rooms", "Kamar terisi"),
+    ("occupancy_rate", "Tingkat hunian (%)"),
+    ("active_tenants", "Penghuni aktif"),
+]
+
+SECTIONS = [
+    ("payments", "Pembayaran", ["Tanggal", "Penghuni", "Metode", "Jumlah"]),
+    ("utilities", "Utilitas", ["Tanggal", "Kamar", "Jenis", "Pemakaian", "Biaya"]),
+    ("canteen", "Kantin", ["Produk", "Jumlah", "Pendapatan"]),
+]
+
+def report_title(report: dict) -> str:
+    return f"Laporan Keuangan {report['property']['name']} - {report['month']}"
+
+def summary_rows(report: dict):
+    return [(label, report["summary"][key]) for key, label in SUMMARY_LABELS]
+
+def render_xlsx(report: dict, path: str):
+    # Write-only mode streams rows to disk instead of keeping every cell in memory
+    workbook = Workbook(write_only=True)
+    bold = Font(bold=True)
+
+    sheet = workbook.create_sheet("Ringkasan")
+    heading = WriteOnlyCell(sheet, value=report_title(report))
+    heading.font = bold
+    sheet.append([heading])
+    sheet.append([])
+    for row in summary_rows(report):
+        sheet.append(list(row))
+
+    for key, title, headers in SECTIONS:
+        sheet = workbook.create_sheet(title)
+        header_row = []
+        for header in headers:
+            cell = WriteOnlyCell(sheet, value=header)
+            cell.font = bold
+            header_row.append(cell)
+        sheet.append(header_row)
+        for row in report[key]:
+            sheet.append(list(row))
+
+    workbook.save(path)
+
+def render_pdf(report: dict, path: str):
+    styles = getSampleStyleSheet()
+    table_style = TableStyle([
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("FONTSIZE", (0, 0), (-1, -1), 8),
+    ])
+
+    story = [
+        Paragraph(report_title(report), styles["Title"]),
+        Paragraph(report["property"].get("address") or "", styles["Normal"]),
+        Spacer(1, 12),
+        Table([["Ringkasan", ""]] + [list(row) for row in summary_rows(report)], style=table_style),
+    ]
+    for key, title, headers in SECTIONS:
+        story.append(Spacer(1, 16))
+        story.append(Paragraph(title, styles["Heading2"]))
+        rows = report[key] or [["-"] * len(headers)]
+        story.append(Table([headers] + [list(row) for row in rows], style=table_style, repeatRows=1))
+
+    SimpleDocTemplate(path, pagesize=A4, title=report_title(report)).build(story)
+
+RENDERERS = {
+    "xlsx": render_xlsx,
+    "pdf": render_pdf,
+}
+
+def render_report(report: dict, report_format: str, path: str) -> str:
+    # Write next to the target and rename so readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    RENDERERS[report_format](report, tmp_path)
+    os.replace(tmp_path, path)
+    return path
@@ -1,13 +1,33 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, BackgroundTasks, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, BackgroundTasks, Query, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
 from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
 from typing import List, Optional
 from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
+import asyncio
+import contextvars
+import gzip
+import json
+import logging
+import math
+import multiprocessing
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit
 
 import midtransclient
 
@@ -16,6 +36,18 @@ import base64
 from pathlib import Path
 from dotenv import load_dotenv
 
+from report_rendering import render_report
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -33,6 +65,8 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "kostify-secret-key-2024")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
 
+logger = logging.getLogger(__name__)
+
 # Models
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -241,6 +275,19 @@ class ComplaintCreate(BaseModel):
     description: str
     priority: str = "medium"
 
+class ReportJobCreate(BaseModel):
+    property_id: str
+    month: str  # YYYY-MM
+    format: str = "xlsx"  # xlsx, pdf
+
+class BatchSubRequest(BaseModel):
+    id: Optional[str] = None
+    method: str = "GET"
+    path: str
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest]
+
 # Auth functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -255,7 +302,13 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Set by /batch so its sub-requests reuse the already authenticated user
+batch_current_user: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("batch_current_user", default=None)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    batch_user = batch_current_user.get()
+    if batch_user is not None:
+        return batch_user
     try:
         token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -269,9 +322,255 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# Response encoding
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+MSGPACK_MEDIA_TYPES = ("application/x-msgpack", "application/msgpack")
+COMPRESSIBLE_MEDIA_TYPES = ("application/json", "application/x-msgpack", "text/")
+
+# Set per request by ContentNegotiationMiddleware, read when a NegotiatedResponse renders
+response_format: contextvars.ContextVar[str] = contextvars.ContextVar("response_format", default="json")
+
+def encode_msgpack(content) -> bytes:
+    return msgpack.packb(content, use_bin_type=True)
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+def parse_quality_values(header: str) -> dict:
+    # "a, b;q=0.5, c;q=0" -> {"a": 1.0, "b": 0.5, "c": 0.0}
+    qualities = {}
+    for part in header.lower().split(","):
+        name, *params = [piece.strip() for piece in part.split(";")]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    pass
+        qualities[name] = max(quality, qualities.get(name, 0.0))
+    return qualities
+
+def choose_response_format(accept: str) -> str:
+    # MessagePack only when the client rates it strictly above JSON; ties keep JSON
+    if msgpack is None:
+        return "json"
+    qualities = parse_quality_values(accept)
+    msgpack_quality = max(qualities.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES)
+    json_quality = max(qualities.get(media_type, 0.0) for media_type in ("application/json", "application/*", "*/*"))
+    return "msgpack" if msgpack_quality > 0 and msgpack_quality > json_quality else "json"
+
+def choose_content_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {name for name, quality in parse_quality_values(accept_encoding).items() if quality > 0}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+class NegotiatedResponse(JSONResponse):
+    """JSON by default, MessagePack when the client asked for it in Accept."""
+
+    def render(self, content) -> bytes:
+        if response_format.get() == "msgpack":
+            self.media_type = MSGPACK_MEDIA_TYPES[0]
+            return encode_msgpack(content)
+        return super().render(content)
+
+    def init_headers(self, headers=None):
+        super().init_headers(headers)
+        MutableHeaders(raw=self.raw_headers).add_vary_header("Accept")
+
+class ContentNegotiationMiddleware:
+    """Picks the body format from Accept and compresses complete responses
+    above COMPRESSION_MIN_SIZE with brotli (when installed) or gzip.
+    Streaming responses pass through untouched."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        token = response_format.set(choose_response_format(headers.get("accept", "")))
+        encoding = choose_content_encoding(headers.get("accept-encoding", ""))
+        try:
+            if encoding is None:
+                await self.app(scope, receive, send)
+                return
+
+            start_message = None
+            streaming = False
+
+            async def send_compressed(message):
+                nonlocal start_message, streaming
+                if message["type"] == "http.response.start":
+                    start_message = message
+                    return
+                if message["type"] != "http.response.body" or streaming:
+                    await send(message)
+                    return
+                if message.get("more_body", False):
+                    streaming = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                body = message.get("body", b"")
+                response_headers = MutableHeaders(raw=start_message["headers"])
+                content_type = response_headers.get("content-type", "")
+                if (
+                    len(body) >= self.minimum_size
+                    and "content-encoding" not in response_headers
+                    and content_type.startswith(COMPRESSIBLE_MEDIA_TYPES)
+                ):
+                    body = compress_body(body, encoding)
+                    response_headers["Content-Encoding"] = encoding
+                    response_headers["Content-Length"] = str(len(body))
+                response_headers.add_vary_header("Accept-Encoding")
+                await send(start_message)
+                await send({"type": "http.response.body", "body": body})
+
+            await self.app(scope, receive, send_compressed)
+        finally:
+            response_format.reset(token)
+
+# Rate limiting
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory, sqlite
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", str(ROOT_DIR / "rate_limit.sqlite3"))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+RATE_LIMIT_TRUSTED_PROXIES = max(1, int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "1")))
+AUTH_IP_BURST = int(os.getenv("AUTH_IP_BURST", "20"))
+AUTH_IP_PER_MINUTE = float(os.getenv("AUTH_IP_PER_MINUTE", "10"))
+AUTH_EMAIL_BURST = int(os.getenv("AUTH_EMAIL_BURST", "5"))
+AUTH_EMAIL_PER_MINUTE = float(os.getenv("AUTH_EMAIL_PER_MINUTE", "2"))
+
+RATE_LIMIT_PRUNE_SECONDS = int(os.getenv("RATE_LIMIT_PRUNE_SECONDS", "60"))
+
+def take_token(tokens: float, updated: float, now: float, capacity: int, refill_per_second: float):
+    """Refill a bucket up to now and take one token.
+
+    Returns (tokens_left, retry_after); retry_after is 0 when the call is allowed.
+    """
+    tokens = min(capacity, tokens + max(0.0, now - updated) * refill_per_second)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / refill_per_second
+
+class MemoryRateLimitBackend:
+    """Token buckets kept in this process only."""
+
+    def __init__(self, max_keys: int = 100_000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self.buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def consume(self, key: str, capacity: int, refill_per_second: float) -> float:
+        now = self.clock()
+        tokens, updated = self.buckets.pop(key, (capacity, now))
+        tokens, retry_after = take_token(tokens, updated, now, capacity, refill_per_second)
+        self.buckets[key] = (tokens, now)
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+class SqliteRateLimitBackend:
+    """Token buckets in a local SQLite file, shared by every worker on the host.
+
+    Falls back to a per-process MemoryRateLimitBackend when the file is locked
+    for longer than the busy timeout, so contention never fails a login.
+    """
+
+    def __init__(self, path: str, clock=time.time, prune_seconds: int = RATE_LIMIT_PRUNE_SECONDS):
+        # Wall-clock time by default because monotonic clocks are not comparable across processes
+        self.clock = clock
+        self.prune_seconds = prune_seconds
+        self.last_prune = 0.0
+        self.fallback = MemoryRateLimitBackend()
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=1, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # full_at is when the bucket is back at capacity; from then on the row is redundant
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS token_buckets_full_at ON token_buckets (full_at)")
+
+    def _consume(self, key: str, capacity: int, refill_per_second: float) -> float:
+        now = self.clock()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT tokens, updated FROM token_buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens, retry_after = take_token(tokens, updated, now, capacity, refill_per_second)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO token_buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                    (key, tokens, now, now + (capacity - tokens) / refill_per_second)
+                )
+                if now - self.last_prune >= self.prune_seconds:
+                    self.conn.execute("DELETE FROM token_buckets WHERE full_at < ?", (now,))
+                    self.last_prune = now
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return retry_after
+
+    async def consume(self, key: str, capacity: int, refill_per_second: float) -> float:
+        try:
+            return await asyncio.to_thread(self._consume, key, capacity, refill_per_second)
+        except sqlite3.OperationalError:
+            logger.warning("Rate limit store busy, using in-process buckets for %s", key)
+            return await self.fallback.consume(key, capacity, refill_per_second)
+
+def create_rate_limit_backend():
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SqliteRateLimitBackend(RATE_LIMIT_SQLITE_PATH)
+    return MemoryRateLimitBackend()
+
+rate_limit_backend = create_rate_limit_backend()
+
+def get_client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        # Proxies append to the right, so everything left of what our own proxies added is
+        # client-controlled; the entry written by the outermost trusted proxy is the real peer
+        hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        if hops:
+            return hops[max(0, len(hops) - RATE_LIMIT_TRUSTED_PROXIES)]
+    return request.client.host if request.client else "unknown"
+
+async def enforce_auth_rate_limit(scope: str, request: Request, email: str):
+    # Runs before any database lookup or bcrypt work so rejected calls stay cheap
+    retry_after = await rate_limit_backend.consume(
+        f"{scope}:ip:{get_client_ip(request)}", AUTH_IP_BURST, AUTH_IP_PER_MINUTE / 60
+    )
+    if not retry_after:
+        retry_after = await rate_limit_backend.consume(
+            f"{scope}:email:{email.lower()}", AUTH_EMAIL_BURST, AUTH_EMAIL_PER_MINUTE / 60
+        )
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts, please try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
 # Auth endpoints
 @api_router.post("/auth/register")
-async def register(user_data: UserCreate):
+async def register(user_data: UserCreate, request: Request):
+    await enforce_auth_rate_limit("register", request, user_data.email)
     existing = await db.users.find_one({"email": user_data.email}, {"_id": 0})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
@@ -312,7 +611,8 @@ async def register(user_data: UserCreate):
     return {"access_token": access_token, "user": user.model_dump()}
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request):
+    await enforce_auth_rate_limit("login", request, credentials.email)
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
     if not user or not verify_password(credentials.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -325,6 +625,113 @@ async def login(credentials: UserLogin):
 async def get_me(current_user: dict = Depends(get_current_user)):
     return current_user
 
+# Activity log
+ACTIVITY_QUEUE_SIZE = int(os.getenv("ACTIVITY_QUEUE_SIZE", "10000"))
+ACTIVITY_BATCH_SIZE = int(os.getenv("ACTIVITY_BATCH_SIZE", "200"))
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "2"))
+ACTIVITY_LOG_TTL_DAYS = int(os.getenv("ACTIVITY_LOG_TTL_DAYS", "365"))
+
+activity_queue: asyncio.Queue = asyncio.Queue(maxsize=ACTIVITY_QUEUE_SIZE)
+
+def log_activity(current_user: dict, action: str, property_id: Optional[str], entity_type: str,
+                 entity_id: Optional[str], details: Optional[dict] = None):
+    # Write-behind: handlers only enqueue, run_activity_writer does the inserts
+    entry = {
+        "id": str(uuid.uuid4()),
+        "property_id": property_id,
+        "user_id": current_user["id"],
+        "user_name": current_user.get("full_name"),
+        "user_role": current_user.get("role"),
+        "action": action,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "details": details or {},
+        # Stored as a BSON date (not an ISO string) so the TTL index can expire it
+        "created_at": datetime.now(timezone.utc)
+    }
+    try:
+        activity_queue.put_nowait(entry)
+    except asyncio.QueueFull:
+        logger.warning("Activity log queue full, dropping %s on %s", action, entity_id)
+
+async def write_activity_batch(batch: List[dict]):
+    try:
+        await db.activity_logs.insert_many(batch, ordered=False)
+    except Exception:
+        logger.exception("Failed to write %d activity log entries", len(batch))
+
+async def run_activity_writer():
+    loop = asyncio.get_running_loop()
+    while True:
+        entry = await activity_queue.get()
+        if entry is None:
+            return
+        batch = [entry]
+        deadline = loop.time() + ACTIVITY_FLUSH_SECONDS
+        stop = False
+        while len(batch) < ACTIVITY_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                entry = await asyncio.wait_for(activity_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if entry is None:
+                stop = True
+                break
+            batch.append(entry)
+        await write_activity_batch(batch)
+        if stop:
+            return
+
+async def stop_activity_writer(writer: asyncio.Task):
+    # The sentinel is queued behind pending entries, so everything before it gets flushed
+    try:
+        await asyncio.wait_for(activity_queue.put(None), ACTIVITY_FLUSH_SECONDS)
+        await asyncio.wait_for(writer, ACTIVITY_FLUSH_SECONDS * 5)
+    except asyncio.TimeoutError:
+        logger.warning("Activity log writer did not finish, %d entries dropped", activity_queue.qsize())
+        writer.cancel()
+
+def property_owner_id(current_user: dict) -> str:
+    return current_user["id"] if current_user["role"] == "owner" else current_user.get("owner_id")
+
+@api_router.get("/properties/{property_id}/activity", response_class=NegotiatedResponse)
+async def get_property_activity(
+    property_id: str,
+    limit: int = 50,
+    before: Optional[datetime] = None,
+    before_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    prop = await db.properties.find_one(
+        {"id": property_id, "owner_id": property_owner_id(current_user)}, {"_id": 0, "id": 1}
+    )
+    if not prop:
+        raise HTTPException(status_code=404, detail="Property not found")
+
+    limit = max(1, min(limit, 200))
+    query = {"property_id": property_id}
+    # BSON dates keep only milliseconds and entries are inserted in batches, so many share
+    # a created_at; id breaks the tie so page boundaries never skip entries
+    if before and before_id:
+        query["$or"] = [
+            {"created_at": {"$lt": before}},
+            {"created_at": before, "id": {"$lt": before_id}}
+        ]
+    elif before:
+        query["created_at"] = {"$lt": before}
+    items = await db.activity_logs.find(query, {"_id": 0}).sort(
+        [("created_at", -1), ("id", -1)]
+    ).limit(limit).to_list(limit)
+    last = items[-1] if len(items) == limit else None
+    return {
+        "items": items,
+        "next_before": last["created_at"] if last else None,
+        "next_before_id": last["id"] if last else None
+    }
+
 # Properties
 @api_router.post("/properties", response_model=Property)
 async def create_property(property_data: PropertyCreate, current_user: dict = Depends(get_current_user)):
@@ -332,9 +739,10 @@ async def create_property(property_data: PropertyCreate, current_user: dict = De
     doc = property_obj.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.properties.insert_one(doc)
+    log_activity(current_user, "property.create", property_obj.id, "property", property_obj.id, {"name": property_obj.name})
     return property_obj
 
-@api_router.get("/properties", response_model=List[Property])
+@api_router.get("/properties", response_model=List[Property], response_class=NegotiatedResponse)
 async def get_properties(current_user: dict = Depends(get_current_user)):
     properties = await db.properties.find({"owner_id": current_user["id"]}, {"_id": 0}).to_list(100)
     for prop in properties:
@@ -359,6 +767,7 @@ async def update_property(property_id: str, property_data: PropertyCreate, curre
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Property not found")
+    log_activity(current_user, "property.update", property_id, "property", property_id)
     return {"message": "Property updated successfully"}
 
 @api_router.delete("/properties/{property_id}")
@@ -366,6 +775,7 @@ async def delete_property(property_id: str, current_user: dict = Depends(get_cur
     result = await db.properties.delete_one({"id": property_id, "owner_id": current_user["id"]})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Property not found")
+    log_activity(current_user, "property.delete", property_id, "property", property_id)
     return {"message": "Property deleted successfully"}
 
 # Rooms
@@ -375,9 +785,10 @@ async def create_room(room_data: RoomCreate, current_user: dict = Depends(get_cu
     doc = room.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.rooms.insert_one(doc)
+    log_activity(current_user, "room.create", room.property_id, "room", room.id, {"room_number": room.room_number})
     return room
 
-@api_router.get("/rooms", response_model=List[Room])
+@api_router.get("/rooms", response_model=List[Room], response_class=NegotiatedResponse)
 async def get_rooms(property_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     query = {}
     if property_id:
@@ -388,18 +799,137 @@ async def get_rooms(property_id: Optional[str] = None, current_user: dict = Depe
             room["created_at"] = datetime.fromisoformat(room["created_at"])
     return rooms
 
+ROOM_PRICE_BUCKETS = [0, 500000, 1000000, 1500000, 2000000, 3000000]
+
+@api_router.get("/rooms/search", response_class=NegotiatedResponse)
+async def search_rooms(
+    status: Optional[str] = "available",
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    room_type: Optional[str] = None,
+    facilities: List[str] = Query([]),
+    property_id: Optional[str] = None,
+    sort: str = "price_asc",
+    page: int = 1,
+    limit: int = 20,
+    current_user: dict = Depends(get_current_user)
+):
+    properties = await db.properties.find(
+        {"owner_id": property_owner_id(current_user)}, {"_id": 0, "id": 1, "name": 1}
+    ).to_list(None)
+    property_names = {prop["id"]: prop["name"] for prop in properties}
+    if property_id and property_id not in property_names:
+        raise HTTPException(status_code=404, detail="Property not found")
+
+    query = {"property_id": property_id if property_id else {"$in": list(property_names)}}
+    if status:
+        query["status"] = status
+    if min_price is not None or max_price is not None:
+        query["price"] = {}
+        if min_price is not None:
+            query["price"]["$gte"] = min_price
+        if max_price is not None:
+            query["price"]["$lte"] = max_price
+    if room_type:
+        query["room_type"] = room_type
+    if facilities:
+        query["facilities"] = {"$all": facilities}
+
+    page = max(page, 1)
+    limit = max(1, min(limit, 100))
+    direction = -1 if sort == "price_desc" else 1
+
+    # One round trip for the page, the total and every facet over the same filtered set
+    result = await db.rooms.aggregate([
+        {"$match": query},
+        {"$facet": {
+            "items": [
+                {"$sort": {"price": direction, "id": 1}},
+                {"$skip": (page - 1) * limit},
+                {"$limit": limit},
+                {"$project": {"_id": 0}}
+            ],
+            "total": [{"$count": "count"}],
+            "by_property": [
+                {"$group": {"_id": "$property_id", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}}
+            ],
+            "by_room_type": [
+                {"$group": {"_id": "$room_type", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}}
+            ],
+            "by_price": [
+                # Without this, prices below the first boundary (or missing) would land in
+                # the "above" default bucket and be reported as 3,000,000+
+                {"$match": {"price": {"$gte": ROOM_PRICE_BUCKETS[0]}}},
+                {"$bucket": {
+                    "groupBy": "$price",
+                    "boundaries": ROOM_PRICE_BUCKETS,
+                    "default": "above",
+                    "output": {"count": {"$sum": 1}}
+                }}
+            ]
+        }}
+    ]).to_list(1)
+    result = result[0]
+
+    price_facets = []
+    for bucket in result["by_price"]:
+        if bucket["_id"] == "above":
+            price_facets.append({"min": ROOM_PRICE_BUCKETS[-1], "max": None, "count": bucket["count"]})
+        else:
+            upper = ROOM_PRICE_BUCKETS[ROOM_PRICE_BUCKETS.index(bucket["_id"]) + 1]
+            price_facets.append({"min": bucket["_id"], "max": upper, "count": bucket["count"]})
+
+    return {
+        "items": result["items"],
+        "total": result["total"][0]["count"] if result["total"] else 0,
+        "page": page,
+        "limit": limit,
+        "facets": {
+            "property": [
+                {"property_id": f["_id"], "name": property_names.get(f["_id"]), "count": f["count"]}
+                for f in result["by_property"]
+            ],
+            "room_type": [{"room_type": f["_id"], "count": f["count"]} for f in result["by_room_type"]],
+            "price": price_facets
+        }
+    }
+
+async def record_room_price(room_id: str, previous_price: Optional[float], price: float):
+    # Rent for a billing month uses the price in effect when it was charged, so a price
+    # change never rewrites earlier statements. The first change also records the price
+    # the room had until then.
+    if previous_price is not None:
+        await db.room_prices.update_one(
+            {"_id": f"{room_id}:initial"},
+            {"$setOnInsert": {"room_id": room_id, "price": previous_price, "effective_from": ""}},
+            upsert=True
+        )
+    await db.room_prices.insert_one({
+        "room_id": room_id,
+        "price": price,
+        "effective_from": datetime.now(timezone.utc).isoformat()
+    })
+
 @api_router.put("/rooms/{room_id}")
 async def update_room(room_id: str, updates: dict, current_user: dict = Depends(get_current_user)):
-    result = await db.rooms.update_one({"id": room_id}, {"$set": updates})
-    if result.matched_count == 0:
+    room = await db.rooms.find_one_and_update(
+        {"id": room_id}, {"$set": updates}, projection={"_id": 0, "property_id": 1, "price": 1}
+    )
+    if room is None:
         raise HTTPException(status_code=404, detail="Room not found")
+    if "price" in updates and updates["price"] != room.get("price"):
+        await record_room_price(room_id, room.get("price"), updates["price"])
+    log_activity(current_user, "room.update", room.get("property_id"), "room", room_id, {"fields": list(updates)})
     return {"message": "Room updated successfully"}
 
 @api_router.delete("/rooms/{room_id}")
 async def delete_room(room_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.rooms.delete_one({"id": room_id})
-    if result.deleted_count == 0:
+    room = await db.rooms.find_one_and_delete({"id": room_id}, projection={"_id": 0, "property_id": 1})
+    if room is None:
         raise HTTPException(status_code=404, detail="Room not found")
+    log_activity(current_user, "room.delete", room.get("property_id"), "room", room_id)
     return {"message": "Room deleted successfully"}
 
 # Tenants
@@ -414,9 +944,10 @@ async def create_tenant(tenant_data: TenantCreate, current_user: dict = Depends(
     
     await db.tenants.insert_one(doc)
     await db.rooms.update_one({"id": tenant_data.room_id}, {"$set": {"status": "occupied"}})
+    log_activity(current_user, "tenant.create", tenant.property_id, "tenant", tenant.id, {"full_name": tenant.full_name})
     return tenant
 
-@api_router.get("/tenants", response_model=List[Tenant])
+@api_router.get("/tenants", response_model=List[Tenant], response_class=NegotiatedResponse)
 async def get_tenants(property_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     query = {}
     if property_id:
@@ -446,11 +977,181 @@ async def get_tenant(tenant_id: str, current_user: dict = Depends(get_current_us
 
 @api_router.put("/tenants/{tenant_id}")
 async def update_tenant(tenant_id: str, updates: dict, current_user: dict = Depends(get_current_user)):
-    result = await db.tenants.update_one({"id": tenant_id}, {"$set": updates})
-    if result.matched_count == 0:
+    tenant = await db.tenants.find_one_and_update(
+        {"id": tenant_id}, {"$set": updates}, projection={"_id": 0, "property_id": 1}
+    )
+    if tenant is None:
         raise HTTPException(status_code=404, detail="Tenant not found")
+    await invalidate_statements([tenant_id])
+    log_activity(current_user, "tenant.update", tenant.get("property_id"), "tenant", tenant_id, {"fields": list(updates)})
     return {"message": "Tenant updated successfully"}
 
+# Tenant statement
+STATEMENT_CACHE_TTL_DAYS = int(os.getenv("STATEMENT_CACHE_TTL_DAYS", "30"))
+
+def statement_entry_stage(date_field: str, entry_type: str, amount, description) -> dict:
+    return {"$project": {
+        "_id": 0,
+        "date": f"${date_field}",
+        "type": {"$literal": entry_type},
+        "reference_id": "$id",
+        "description": description,
+        "amount": amount
+    }}
+
+def as_iso(value) -> str:
+    return value if isinstance(value, str) else value.isoformat()
+
+def price_at(price_history: List[dict], when: str, default: float) -> float:
+    # price_history is sorted by effective_from; the last entry already in effect wins
+    price = default
+    for entry in price_history:
+        if entry["effective_from"] > when:
+            break
+        price = entry["price"]
+    return price
+
+def rent_charges(tenant: dict, price: float, end: Optional[datetime], price_history: List[dict] = ()) -> List[dict]:
+    # One charge per billing month of the stay: the first on check-in, then on each local
+    # month start, up to check-out, the statement end or today, whichever comes first.
+    # Each charge uses the room price in effect on its date, falling back to price.
+    stop = datetime.now(timezone.utc)
+    if end:
+        stop = min(stop, parse_timestamp(end))
+    if tenant.get("check_out_date"):
+        stop = min(stop, parse_timestamp(tenant["check_out_date"]))
+
+    charges = []
+    charge_at = parse_timestamp(tenant["check_in_date"])
+    while charge_at < stop:
+        period = billing_period_start(charge_at)
+        date = charge_at.astimezone(timezone.utc).isoformat()
+        charges.append({
+            "date": date,
+            "type": "rent",
+            "reference_id": tenant["room_id"],
+            "description": f"Sewa {period:%Y-%m}",
+            "amount": price_at(price_history, date, price)
+        })
+        charge_at = (period + timedelta(days=32)).replace(day=1).astimezone(timezone.utc)
+    return charges
+
+async def invalidate_statements(tenant_ids):
+    # Cached statements of closed months go stale when late entries land in them
+    tenant_ids = [tenant_id for tenant_id in tenant_ids if tenant_id]
+    if tenant_ids:
+        await db.statement_cache.delete_many({"tenant_id": {"$in": tenant_ids}})
+
+async def build_statement_pipeline(tenant: dict, end: Optional[datetime]) -> List[dict]:
+    # Charges are positive and payments negative, so the running sum is what the tenant owes.
+    # The start bound is applied afterwards so earlier entries still feed the opening balance.
+    check_in = as_iso(tenant["check_in_date"])
+    stay = {"$gte": check_in}
+    if tenant.get("check_out_date"):
+        stay["$lt"] = as_iso(tenant["check_out_date"])
+
+    payment_match = {"tenant_id": tenant["id"], "status": "approved"}
+    canteen_match = {"tenant_id": tenant["id"]}
+    if end:
+        payment_match["payment_date"] = {"$lt": end.isoformat()}
+        canteen_match["transaction_date"] = {"$lt": end.isoformat()}
+        stay["$lt"] = min(stay.get("$lt", end.isoformat()), end.isoformat())
+    meter_match = {"room_id": tenant["room_id"], "reading_date": stay}
+
+    payment_stages = [
+        {"$match": payment_match},
+        statement_entry_stage("payment_date", "payment", {"$multiply": ["$amount", -1]}, "$notes")
+    ]
+    canteen_stages = [
+        {"$match": canteen_match},
+        statement_entry_stage("transaction_date", "canteen", "$total_price", "$notes")
+    ]
+    meter_stages = [
+        {"$match": meter_match},
+        statement_entry_stage("reading_date", "utility", "$total_cost", "$meter_type")
+    ]
+
+    archive_since = datetime.fromisoformat(check_in)
+    pipeline = list(payment_stages)
+    for year in await archive_years("payments", archive_since, end):
+        pipeline.append({"$unionWith": {"coll": archive_collection_name("payments", year), "pipeline": payment_stages}})
+    pipeline.append({"$unionWith": {"coll": "utility_meters", "pipeline": meter_stages}})
+    pipeline.append({"$unionWith": {"coll": "canteen_transactions", "pipeline": canteen_stages}})
+    for year in await archive_years("canteen_transactions", archive_since, end):
+        pipeline.append({"$unionWith": {"coll": archive_collection_name("canteen_transactions", year), "pipeline": canteen_stages}})
+    pipeline.append({"$sort": {"date": 1, "type": 1}})
+    return pipeline
+
+@api_router.get("/tenants/{tenant_id}/statement", response_class=NegotiatedResponse)
+async def get_tenant_statement(
+    tenant_id: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    tenant = await db.tenants.find_one({"id": tenant_id}, {"_id": 0})
+    if not tenant:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+
+    # Stored dates are UTC text, so bounds are normalised before any text comparison
+    start_date = parse_timestamp(start_date).astimezone(timezone.utc) if start_date else None
+    end_date = parse_timestamp(end_date).astimezone(timezone.utc) if end_date else None
+
+    # Months before the current one are closed, so their statements can be reused
+    closed = end_date is not None and end_date <= billing_period_start(datetime.now(timezone.utc))
+    cache_key = f"{tenant_id}:{start_date.isoformat() if start_date else ''}:{end_date.isoformat() if end_date else ''}"
+    if closed:
+        cached = await db.statement_cache.find_one({"_id": cache_key}, {"_id": 0, "statement": 1})
+        if cached:
+            return cached["statement"]
+
+    since = start_date.isoformat() if start_date else ""
+    pipeline = await build_statement_pipeline(tenant, end_date)
+    pipeline.append({"$facet": {
+        "opening": [
+            {"$match": {"date": {"$lt": since}}},
+            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+        ],
+        "entries": [{"$match": {"date": {"$gte": since}}}]
+    }})
+    result = (await db.payments.aggregate(pipeline).to_list(1))[0]
+
+    opening_balance = result["opening"][0]["total"] if result["opening"] else 0
+    entries = result["entries"]
+    room = await db.rooms.find_one({"id": tenant["room_id"]}, {"_id": 0, "price": 1})
+    if room:
+        price_history = await db.room_prices.find(
+            {"room_id": tenant["room_id"]}, {"_id": 0, "price": 1, "effective_from": 1}
+        ).sort("effective_from", 1).to_list(None)
+        for charge in rent_charges(tenant, room["price"], end_date, price_history):
+            if charge["date"] < since:
+                opening_balance += charge["amount"]
+            else:
+                entries.append(charge)
+        entries.sort(key=lambda entry: (entry["date"], entry["type"]))
+
+    balance = opening_balance
+    for entry in entries:
+        balance += entry["amount"] or 0
+        entry["balance"] = balance
+
+    statement = {
+        "tenant_id": tenant_id,
+        "full_name": tenant.get("full_name"),
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "opening_balance": opening_balance,
+        "closing_balance": balance,
+        "entries": entries
+    }
+    if closed:
+        await db.statement_cache.update_one(
+            {"_id": cache_key},
+            {"$set": {"tenant_id": tenant_id, "statement": statement, "created_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+    return statement
+
 # Payments
 @api_router.post("/payments", response_model=Payment)
 async def create_payment(payment_data: PaymentCreate, current_user: dict = Depends(get_current_user)):
@@ -459,9 +1160,10 @@ async def create_payment(payment_data: PaymentCreate, current_user: dict = Depen
     doc["created_at"] = doc["created_at"].isoformat()
     doc["payment_date"] = doc["payment_date"].isoformat()
     await db.payments.insert_one(doc)
+    log_activity(current_user, "payment.create", payment.property_id, "payment", payment.id, {"amount": payment.amount})
     return payment
 
-@api_router.get("/payments", response_model=List[Payment])
+@api_router.get("/payments", response_model=List[Payment], response_class=NegotiatedResponse)
 async def get_payments(property_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     query = {}
     if property_id:
@@ -495,10 +1197,11 @@ async def create_pengelola(pengelola_data: PengelolaCreate, current_user: dict =
     doc["created_at"] = doc["created_at"].isoformat()
     
     await db.users.insert_one(doc)
+    log_activity(current_user, "pengelola.create", pengelola_data.property_id, "user", pengelola.id, {"email": pengelola.email})
     
     return {"message": "Pengelola berhasil ditambahkan", "pengelola_id": pengelola.id}
 
-@api_router.get("/pengelola")
+@api_router.get("/pengelola", response_class=NegotiatedResponse)
 async def get_pengelola_list(current_user: dict = Depends(get_current_user)):
     if current_user["role"] != "owner":
         raise HTTPException(status_code=403, detail="Only owner can view pengelola list")
@@ -532,9 +1235,10 @@ async def create_canteen_product(product_data: CanteenProductCreate, current_use
     doc = product.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
     await db.canteen_products.insert_one(doc)
+    log_activity(current_user, "canteen_product.create", product.property_id, "canteen_product", product.id, {"name": product.name})
     return product
 
-@api_router.get("/canteen/products", response_model=List[CanteenProduct])
+@api_router.get("/canteen/products", response_model=List[CanteenProduct], response_class=NegotiatedResponse)
 async def get_canteen_products(property_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     query = {}
     if property_id:
@@ -548,16 +1252,20 @@ async def get_canteen_products(property_id: Optional[str] = None, current_user:
 
 @api_router.put("/canteen/products/{product_id}")
 async def update_canteen_product(product_id: str, updates: dict, current_user: dict = Depends(get_current_user)):
-    result = await db.canteen_products.update_one({"id": product_id}, {"$set": updates})
-    if result.matched_count == 0:
+    product = await db.canteen_products.find_one_and_update(
+        {"id": product_id}, {"$set": updates}, projection={"_id": 0, "property_id": 1}
+    )
+    if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
+    log_activity(current_user, "canteen_product.update", product.get("property_id"), "canteen_product", product_id, {"fields": list(updates)})
     return {"message": "Product updated successfully"}
 
 @api_router.delete("/canteen/products/{product_id}")
 async def delete_canteen_product(product_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.canteen_products.delete_one({"id": product_id})
-    if result.deleted_count == 0:
+    product = await db.canteen_products.find_one_and_delete({"id": product_id}, projection={"_id": 0, "property_id": 1})
+    if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
+    log_activity(current_user, "canteen_product.delete", product.get("property_id"), "canteen_product", product_id)
     return {"message": "Product deleted successfully"}
 
 # Canteen Transactions
@@ -586,10 +1294,15 @@ async def create_canteen_transaction(transaction_data: CanteenTransactionCreate,
         {"id": transaction_data.product_id},
         {"$set": {"stock": new_stock, "is_available": new_stock > 0}}
     )
+    await invalidate_statements([transaction.tenant_id])
+    log_activity(
+        current_user, "canteen_transaction.create", transaction.property_id, "canteen_transaction", transaction.id,
+        {"product_id": transaction.product_id, "quantity": transaction.quantity, "total_price": total_price}
+    )
     
     return transaction
 
-@api_router.get("/canteen/transactions", response_model=List[CanteenTransaction])
+@api_router.get("/canteen/transactions", response_model=List[CanteenTransaction], response_class=NegotiatedResponse)
 async def get_canteen_transactions(property_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     query = {}
     if property_id:
@@ -699,32 +1412,54 @@ async def midtrans_webhook(request: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/canteen/sales-report")
-async def get_canteen_sales_report(property_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+@api_router.get("/canteen/sales-report", response_class=NegotiatedResponse)
+async def get_canteen_sales_report(
+    property_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
     query = {} if not property_id else {"property_id": property_id}
     
-    # Total revenue
-    total_revenue = await db.canteen_transactions.aggregate([
-        {"$match": query},
-        {"$group": {"_id": None, "total": {"$sum": "$total_price"}}}
-    ]).to_list(1)
+    # Totals and per-product sums in one pass; archive collections are only added when an
+    # explicit range reaches before the archive cutoff
+    cursor = await aggregate_with_history("canteen_transactions", query, start_date, end_date, [
+        {"$facet": {
+            "totals": [
+                {"$group": {"_id": None, "total": {"$sum": "$total_price"}, "count": {"$sum": 1}}}
+            ],
+            "products": [
+                {"$group": {
+                    "_id": "$product_id",
+                    "total_quantity": {"$sum": "$quantity"},
+                    "total_revenue": {"$sum": "$total_price"}
+                }}
+            ]
+        }}
+    ])
+    report = (await cursor.to_list(1))[0]
+    totals = report["totals"][0] if report["totals"] else {"total": 0, "count": 0}
+    revenue = totals["total"]
+    total_transactions = totals["count"]
+    products = {product["_id"]: product for product in report["products"]}
     
-    revenue = total_revenue[0]["total"] if total_revenue else 0
-    
-    # Total transactions
-    total_transactions = await db.canteen_transactions.count_documents(query)
+    # The everyday all-time report adds pre-summed archive totals instead of scanning archives
+    if archive_totals_cover(start_date, end_date):
+        async for archived in db.archive_totals.find({**query, "collection": "canteen_transactions"}, {"_id": 0}):
+            revenue += archived["revenue"]
+            total_transactions += archived["transactions"]
+            product = products.setdefault(
+                archived["product_id"],
+                {"_id": archived["product_id"], "total_quantity": 0, "total_revenue": 0}
+            )
+            product["total_quantity"] += archived["quantity"]
+            product["total_revenue"] += archived["revenue"]
     
-    # Top products
-    top_products = await db.canteen_transactions.aggregate([
-        {"$match": query},
-        {"$group": {
-            "_id": "$product_id",
-            "total_quantity": {"$sum": "$quantity"},
-            "total_revenue": {"$sum": "$total_price"}
-        }},
-        {"$sort": {"total_quantity": -1}},
-        {"$limit": 5}
-    ]).to_list(5)
+    top_products = sorted(
+        products.values(),
+        key=lambda product: (product["total_quantity"], product["total_revenue"]),
+        reverse=True
+    )[:5]
     
     return {
         "total_revenue": revenue,
@@ -748,14 +1483,21 @@ async def approve_payment(payment_id: str, current_user: dict = Depends(get_curr
     payment = await db.payments.find_one({"id": payment_id}, {"_id": 0})
     if payment:
         await db.tenants.update_one({"id": payment["tenant_id"]}, {"$set": {"payment_status": "paid"}})
+        await invalidate_statements([payment["tenant_id"]])
+        log_activity(current_user, "payment.approve", payment["property_id"], "payment", payment_id, {"amount": payment["amount"]})
     
     return {"message": "Payment approved successfully"}
 
 @api_router.put("/payments/{payment_id}/reject")
 async def reject_payment(payment_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.payments.update_one({"id": payment_id}, {"$set": {"status": "rejected"}})
-    if result.matched_count == 0:
+    payment = await db.payments.find_one_and_update(
+        {"id": payment_id}, {"$set": {"status": "rejected"}}, projection={"_id": 0, "property_id": 1, "tenant_id": 1}
+    )
+    if payment is None:
         raise HTTPException(status_code=404, detail="Payment not found")
+    # A payment rejected after approval must lose its credit in cached statements too
+    await invalidate_statements([payment.get("tenant_id")])
+    log_activity(current_user, "payment.reject", payment.get("property_id"), "payment", payment_id)
     return {"message": "Payment rejected"}
 
 # Utility Meters
@@ -767,9 +1509,11 @@ async def create_utility_meter(meter_data: UtilityMeterCreate, current_user: dic
     doc["created_at"] = doc["created_at"].isoformat()
     doc["reading_date"] = doc["reading_date"].isoformat()
     await db.utility_meters.insert_one(doc)
+    await invalidate_statements(await db.tenants.distinct("id", {"room_id": meter.room_id}))
+    log_activity(current_user, "utility_meter.create", meter.property_id, "utility_meter", meter.id, {"total_cost": meter.total_cost})
     return meter
 
-@api_router.get("/utility-meters", response_model=List[UtilityMeter])
+@api_router.get("/utility-meters", response_model=List[UtilityMeter], response_class=NegotiatedResponse)
 async def get_utility_meters(room_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     query = {}
     if room_id:
@@ -790,9 +1534,10 @@ async def create_complaint(complaint_data: ComplaintCreate, current_user: dict =
     doc["created_at"] = doc["created_at"].isoformat()
     doc["updated_at"] = doc["updated_at"].isoformat()
     await db.complaints.insert_one(doc)
+    log_activity(current_user, "complaint.create", complaint.property_id, "complaint", complaint.id, {"title": complaint.title})
     return complaint
 
-@api_router.get("/complaints", response_model=List[Complaint])
+@api_router.get("/complaints", response_model=List[Complaint], response_class=NegotiatedResponse)
 async def get_complaints(property_id: Optional[str] = None, status: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     query = {}
     if property_id:
@@ -809,16 +1554,18 @@ async def get_complaints(property_id: Optional[str] = None, status: Optional[str
 
 @api_router.put("/complaints/{complaint_id}/status")
 async def update_complaint_status(complaint_id: str, status: str, current_user: dict = Depends(get_current_user)):
-    result = await db.complaints.update_one(
+    complaint = await db.complaints.find_one_and_update(
         {"id": complaint_id},
-        {"$set": {"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}},
+        projection={"_id": 0, "property_id": 1}
     )
-    if result.matched_count == 0:
+    if complaint is None:
         raise HTTPException(status_code=404, detail="Complaint not found")
+    log_activity(current_user, "complaint.status", complaint.get("property_id"), "complaint", complaint_id, {"status": status})
     return {"message": "Complaint status updated"}
 
 # Dashboard Analytics
-@api_router.get("/dashboard/stats")
+@api_router.get("/dashboard/stats", response_class=NegotiatedResponse)
 async def get_dashboard_stats(property_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     query = {} if not property_id else {"property_id": property_id}
     owner_query = {"owner_id": current_user["id"]}
@@ -836,7 +1583,15 @@ async def get_dashboard_stats(property_id: Optional[str] = None, current_user: d
         {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
     ]).to_list(1)
     
+    # Archived payments are pre-summed per year, so the dashboard never scans archives
+    archived_revenue = await db.archive_totals.aggregate([
+        {"$match": {**query, "collection": "payments"}},
+        {"$group": {"_id": None, "total": {"$sum": "$approved_amount"}}}
+    ]).to_list(1)
+    
     revenue = total_revenue[0]["total"] if total_revenue else 0
+    if archived_revenue:
+        revenue += archived_revenue[0]["total"]
     
     open_complaints = await db.complaints.count_documents({**query, "status": "open"})
     
@@ -852,8 +1607,660 @@ async def get_dashboard_stats(property_id: Optional[str] = None, current_user: d
         "open_complaints": open_complaints
     }
 
+# Monthly reports
+REPORTS_DIR = Path(os.getenv("REPORTS_DIR", str(ROOT_DIR / "reports")))
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_JOB_LEASE_SECONDS = int(os.getenv("REPORT_JOB_LEASE_SECONDS", "120"))
+REPORT_CURSOR_BATCH_SIZE = 500
+REPORT_MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+
+report_pool: Optional[ProcessPoolExecutor] = None
+report_tasks: set = set()
+
+def get_report_pool() -> ProcessPoolExecutor:
+    # Spawned workers import only report_rendering, not this module and its db client
+    global report_pool
+    if report_pool is None:
+        report_pool = ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return report_pool
+
+def report_month_range(month: str):
+    # Same local calendar as billing_period_start, returned in UTC to match stored dates
+    try:
+        start = datetime.strptime(month, "%Y-%m").replace(tzinfo=BUSINESS_TIMEZONE)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Month must use the YYYY-MM format")
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+def local_date(value) -> str:
+    return parse_timestamp(value).astimezone(BUSINESS_TIMEZONE).date().isoformat()
+
+def report_job_response(job: dict) -> dict:
+    return {
+        "id": job["id"],
+        "property_id": job["property_id"],
+        "month": job["month"],
+        "format": job["format"],
+        "status": job["status"],
+        "error": job.get("error"),
+        "created_at": job["created_at"],
+        "finished_at": job.get("finished_at"),
+        "download_url": f"/api/reports/{job['id']}/download" if job["status"] == "done" else None
+    }
+
+async def gather_monthly_report(prop: dict, month: str, start: datetime, end: datetime) -> dict:
+    property_id = prop["id"]
+    payments = []
+    rent_collected = 0
+    cursor = await aggregate_with_history("payments", {"property_id": property_id, "status": "approved"}, start, end, [
+        {"$sort": {"payment_date": 1}},
+        {"$lookup": {"from": "tenants", "localField": "tenant_id", "foreignField": "id", "as": "tenant"}},
+        {"$project": {
+            "_id": 0,
+            "payment_date": 1,
+            "payment_method": 1,
+            "amount": 1,
+            "tenant_name": {"$arrayElemAt": ["$tenant.full_name", 0]}
+        }}
+    ])
+    async for payment in cursor.batch_size(REPORT_CURSOR_BATCH_SIZE):
+        payments.append([local_date(payment["payment_date"]), payment.get("tenant_name") or "-", payment["payment_method"], payment["amount"]])
+        rent_collected += payment["amount"]
+
+    utilities = []
+    utility_charges = 0
+    cursor = db.utility_meters.aggregate([
+        {"$match": {"property_id": property_id, "reading_date": {"$gte": start.isoformat(), "$lt": end.isoformat()}}},
+        {"$sort": {"reading_date": 1}},
+        {"$lookup": {"from": "rooms", "localField": "room_id", "foreignField": "id", "as": "room"}},
+        {"$project": {
+            "_id": 0,
+            "reading_date": 1,
+            "meter_type": 1,
+            "usage": {"$subtract": ["$current_reading", "$previous_reading"]},
+            "total_cost": 1,
+            "room_number": {"$arrayElemAt": ["$room.room_number", 0]}
+        }}
+    ])
+    async for meter in cursor.batch_size(REPORT_CURSOR_BATCH_SIZE):
+        utilities.append([local_date(meter["reading_date"]), meter.get("room_number") or "-", meter["meter_type"], meter["usage"], meter["total_cost"]])
+        utility_charges += meter["total_cost"]
+
+    canteen = []
+    canteen_revenue = 0
+    cursor = await aggregate_with_history("canteen_transactions", {"property_id": property_id}, start, end, [
+        {"$group": {"_id": "$product_id", "quantity": {"$sum": "$quantity"}, "revenue": {"$sum": "$total_price"}}},
+        {"$sort": {"revenue": -1}},
+        {"$lookup": {"from": "canteen_products", "localField": "_id", "foreignField": "id", "as": "product"}},
+        {"$project": {"quantity": 1, "revenue": 1, "name": {"$arrayElemAt": ["$product.name", 0]}}}
+    ])
+    async for product in cursor.batch_size(REPORT_CURSOR_BATCH_SIZE):
+        canteen.append([product.get("name") or product["_id"], product["quantity"], product["revenue"]])
+        canteen_revenue += product["revenue"]
+
+    # Occupancy comes from the stays overlapping the month, not today's room status,
+    # so reports for past months stay correct after tenants move in or out
+    total_rooms = await db.rooms.count_documents({"property_id": property_id})
+    stays = await db.tenants.aggregate([
+        {"$match": {
+            "property_id": property_id,
+            "check_in_date": {"$lt": end.isoformat()},
+            "$or": [{"check_out_date": None}, {"check_out_date": {"$gte": start.isoformat()}}]
+        }},
+        {"$group": {"_id": None, "rooms": {"$addToSet": "$room_id"}, "tenants": {"$sum": 1}}}
+    ]).to_list(1)
+    occupied_rooms = len(stays[0]["rooms"]) if stays else 0
+    active_tenants = stays[0]["tenants"] if stays else 0
+
+    return {
+        "property": {"id": property_id, "name": prop["name"], "address": prop.get("address")},
+        "month": month,
+        "summary": {
+            "rent_collected": rent_collected,
+            "utility_charges": utility_charges,
+            "canteen_revenue": canteen_revenue,
+            "total_rooms": total_rooms,
+            "occupied_rooms": occupied_rooms,
+            "occupancy_rate": round(occupied_rooms / total_rooms * 100, 2) if total_rooms else 0,
+            "active_tenants": active_tenants
+        },
+        "payments": payments,
+        "utilities": utilities,
+        "canteen": canteen
+    }
+
+async def finish_report_job(job_id: str, job_status: str, **fields):
+    # Dropping the active flag frees the unique (property, month, format) slot for a new job
+    await db.report_jobs.update_one(
+        {"id": job_id, "active": True},
+        {"$set": {"status": job_status, "finished_at": datetime.now(timezone.utc).isoformat(), **fields},
+         "$unset": {"active": ""}}
+    )
+
+async def fail_expired_report_jobs(query: Optional[dict] = None):
+    # Active jobs hold a lease renewed by their worker's heartbeat. A job whose lease
+    # lapsed lost its worker (crash or restart) and will never finish; live jobs of
+    # other workers keep renewing and are left alone.
+    now = datetime.now(timezone.utc)
+    result = await db.report_jobs.update_many(
+        {**(query or {}), "active": True,
+         "heartbeat_at": {"$lt": (now - timedelta(seconds=REPORT_JOB_LEASE_SECONDS)).isoformat()}},
+        {"$set": {
+            "status": "failed",
+            "error": "Worker stopped before the report finished",
+            "finished_at": now.isoformat()
+        }, "$unset": {"active": ""}}
+    )
+    if result.modified_count:
+        logger.warning("Marked %d abandoned report jobs as failed", result.modified_count)
+
+async def keep_report_job_alive(job_id: str):
+    while True:
+        await asyncio.sleep(REPORT_JOB_LEASE_SECONDS / 4)
+        try:
+            await db.report_jobs.update_one(
+                {"id": job_id, "active": True},
+                {"$set": {"heartbeat_at": datetime.now(timezone.utc).isoformat()}}
+            )
+        except Exception:
+            logger.warning("Heartbeat for report job %s failed", job_id, exc_info=True)
+
+async def run_report_job(job: dict, prop: dict, start: datetime, end: datetime):
+    global report_pool
+    heartbeat = asyncio.create_task(keep_report_job_alive(job["id"]))
+    await db.report_jobs.update_one({"id": job["id"]}, {"$set": {"status": "running"}})
+    try:
+        report = await gather_monthly_report(prop, job["month"], start, end)
+        REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = str(REPORTS_DIR / f"{job['id']}.{job['format']}")
+        # Formatting is CPU-bound, keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(get_report_pool(), render_report, report, job["format"], path)
+        await finish_report_job(job["id"], "done", file_path=path)
+    except Exception as e:
+        logger.exception("Report job %s failed", job["id"])
+        if isinstance(e, BrokenProcessPool):
+            # A crashed worker poisons the whole pool; start a fresh one for the next job
+            report_pool = None
+        await finish_report_job(job["id"], "failed", error=str(e))
+    finally:
+        heartbeat.cancel()
+
+@api_router.post("/reports")
+async def create_report_job(job_data: ReportJobCreate, current_user: dict = Depends(get_current_user)):
+    if job_data.format not in REPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Format must be xlsx or pdf")
+    start, end = report_month_range(job_data.month)
+    owner_id = property_owner_id(current_user)
+    prop = await db.properties.find_one({"id": job_data.property_id, "owner_id": owner_id}, {"_id": 0})
+    if not prop:
+        raise HTTPException(status_code=404, detail="Property not found")
+
+    now = datetime.now(timezone.utc)
+    key = {"property_id": job_data.property_id, "month": job_data.month, "format": job_data.format}
+    # An abandoned job must not hold the unique slot and block new requests
+    await fail_expired_report_jobs(key)
+    active = await db.report_jobs.find_one({**key, "active": True}, {"_id": 0})
+    if active:
+        return report_job_response(active)
+
+    # Closed months no longer change, so their finished file is reused as is
+    if end <= billing_period_start(now):
+        done = await db.report_jobs.find_one({**key, "status": "done"}, {"_id": 0}, sort=[("created_at", -1)])
+        if done and os.path.exists(done["file_path"]):
+            return report_job_response(done)
+
+    job = {
+        "id": str(uuid.uuid4()),
+        **key,
+        "owner_id": owner_id,
+        "requested_by": current_user["id"],
+        "status": "queued",
+        "active": True,
+        "worker": WORKER_ID,
+        "created_at": now.isoformat(),
+        "heartbeat_at": now.isoformat()
+    }
+    try:
+        await db.report_jobs.insert_one(dict(job))
+    except DuplicateKeyError:
+        # A concurrent identical request won the unique index; hand back its job
+        active = await db.report_jobs.find_one({**key, "active": True}, {"_id": 0})
+        if active:
+            return report_job_response(active)
+        raise HTTPException(status_code=409, detail="Report is already being generated, try again")
+    task = asyncio.create_task(run_report_job(job, prop, start, end))
+    report_tasks.add(task)
+    task.add_done_callback(report_tasks.discard)
+    return report_job_response(job)
+
+@api_router.get("/reports/{job_id}")
+async def get_report_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    await fail_expired_report_jobs({"id": job_id})
+    job = await db.report_jobs.find_one({"id": job_id, "owner_id": property_owner_id(current_user)}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return report_job_response(job)
+
+@api_router.get("/reports/{job_id}/download")
+async def download_report(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await db.report_jobs.find_one({"id": job_id, "owner_id": property_owner_id(current_user)}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if job["status"] != "done" or not os.path.exists(job["file_path"]):
+        raise HTTPException(status_code=409, detail="Report is not ready")
+    return FileResponse(
+        job["file_path"],
+        media_type=REPORT_MEDIA_TYPES[job["format"]],
+        filename=f"laporan-{job['property_id']}-{job['month']}.{job['format']}"
+    )
+
+# Batch requests
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "6"))
+
+# Shared by every /batch call, so the cap holds for the whole process, not per batch
+batch_semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+async def dispatch_batch_sub_request(request: Request, sub_request: BatchSubRequest):
+    url = urlsplit(sub_request.path)
+    if sub_request.method.upper() != "GET":
+        return {"id": sub_request.id, "status": 405, "body": {"detail": "Only GET requests can be batched"}}
+    if not url.path.startswith("/api/") or url.path.rstrip("/") == "/api/batch":
+        return {"id": sub_request.id, "status": 400, "body": {"detail": "Invalid batch path"}}
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": request.url.scheme,
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "root_path": "",
+        "headers": [
+            (b"authorization", request.headers.get("authorization", "").encode()),
+            (b"accept", b"application/json"),
+        ],
+        "client": request.scope.get("client"),
+        "server": request.scope.get("server"),
+    }
+    response = {"status": 500, "body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    async with batch_semaphore:
+        try:
+            await app(scope, receive, send)
+        except Exception as e:
+            # ServerErrorMiddleware re-raises after sending its 500; keep it to this item
+            logger.exception("Batch sub-request %s failed", sub_request.path)
+            return {"id": sub_request.id, "status": 500, "body": {"detail": str(e) or "Internal Server Error"}}
+
+    try:
+        body = json.loads(response["body"]) if response["body"] else None
+    except ValueError:
+        body = response["body"].decode(errors="replace")
+    return {"id": sub_request.id, "status": response["status"], "body": body}
+
+@api_router.post("/batch")
+async def batch_requests(batch: BatchRequest, request: Request, current_user: dict = Depends(get_current_user)):
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} requests per batch")
+
+    token = batch_current_user.set(current_user)
+    try:
+        responses = await asyncio.gather(*[
+            dispatch_batch_sub_request(request, sub_request)
+            for sub_request in batch.requests
+        ])
+    finally:
+        batch_current_user.reset(token)
+    return {"responses": responses}
+
+# Background Jobs
+ENABLE_SCHEDULER = os.getenv("ENABLE_SCHEDULER", "true").lower() == "true"
+JOB_POLL_SECONDS = int(os.getenv("JOB_POLL_SECONDS", "60"))
+OVERDUE_SCAN_INTERVAL_SECONDS = int(os.getenv("OVERDUE_SCAN_INTERVAL_SECONDS", "3600"))
+OVERDUE_GRACE_DAYS = int(os.getenv("OVERDUE_GRACE_DAYS", "5"))
+OVERDUE_BATCH_SIZE = int(os.getenv("OVERDUE_BATCH_SIZE", "500"))
+OVERDUE_BATCH_PAUSE_SECONDS = float(os.getenv("OVERDUE_BATCH_PAUSE_SECONDS", "0.1"))
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+scheduled_tasks: List[asyncio.Task] = []
+activity_writer: List[asyncio.Task] = []
+
+async def acquire_job_lease(job_name: str, lease_seconds: int) -> bool:
+    # One document per job; the worker whose upsert succeeds holds the lease until
+    # locked_until, everyone else hits DuplicateKeyError and skips this run.
+    now = datetime.now(timezone.utc)
+    try:
+        await db.job_locks.find_one_and_update(
+            {"_id": job_name, "locked_until": {"$lt": now.isoformat()}},
+            {"$set": {
+                "owner": WORKER_ID,
+                "locked_until": (now + timedelta(seconds=lease_seconds)).isoformat()
+            }},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def release_job_lease(job_name: str):
+    await db.job_locks.update_one(
+        {"_id": job_name, "owner": WORKER_ID},
+        {"$set": {"locked_until": datetime.now(timezone.utc).isoformat()}}
+    )
+
+async def record_job_run(job_name: str, started_at: datetime, run_status: str, summary: dict):
+    finished_at = datetime.now(timezone.utc)
+    await db.job_runs.insert_one({
+        "id": str(uuid.uuid4()),
+        "job": job_name,
+        "worker": WORKER_ID,
+        "status": run_status,
+        "started_at": started_at.isoformat(),
+        "finished_at": finished_at.isoformat(),
+        "duration_seconds": round((finished_at - started_at).total_seconds(), 3),
+        "summary": summary
+    })
+
+async def run_periodic_job(job_name: str, interval_seconds: int, job):
+    # The lease is held for a full interval so the job runs once per interval
+    # no matter how many workers poll for it.
+    while True:
+        try:
+            if await acquire_job_lease(job_name, interval_seconds):
+                started_at = datetime.now(timezone.utc)
+                try:
+                    summary = await job()
+                    run_status = "success"
+                except Exception as e:
+                    logger.exception("Job %s failed", job_name)
+                    summary = {"error": str(e)}
+                    run_status = "failed"
+                    await release_job_lease(job_name)
+                await record_job_run(job_name, started_at, run_status, summary)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Scheduler error for job %s", job_name)
+        await asyncio.sleep(min(interval_seconds, JOB_POLL_SECONDS))
+
+BUSINESS_TIMEZONE = ZoneInfo(os.getenv("BUSINESS_TIMEZONE", "Asia/Jakarta"))
+
+def billing_period_start(now: datetime) -> datetime:
+    # Billing months follow the owners' local calendar, not UTC
+    local_now = now.astimezone(BUSINESS_TIMEZONE)
+    return local_now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def parse_timestamp(value) -> datetime:
+    # Stored timestamps are ISO strings with mixed offsets; naive ones were written as UTC
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def timestamp_expr(field: str) -> dict:
+    # Aggregation counterpart of parse_timestamp, so comparisons are by instant, not by text
+    return {"$dateFromString": {"dateString": f"${field}", "onError": None, "onNull": None}}
+
+def timestamp_prefilter(bound: datetime, operator: str) -> dict:
+    # Text range on the date part, widened by a day to cover any UTC offset.
+    # Only narrows the index scan; the $expr comparison decides.
+    if operator == "$gte":
+        return {"$gte": (bound - timedelta(days=1)).date().isoformat()}
+    return {"$lt": (bound + timedelta(days=1)).date().isoformat()}
+
+async def mark_overdue_tenants():
+    now = datetime.now(timezone.utc)
+    period_start = billing_period_start(now)
+    summary = {
+        "period_start": period_start.isoformat(),
+        "properties_scanned": 0,
+        "tenants_scanned": 0,
+        "tenants_marked_overdue": 0
+    }
+    if now < period_start + timedelta(days=OVERDUE_GRACE_DAYS):
+        summary["skipped"] = "grace_period"
+        return summary
+
+    async for prop in db.properties.find({}, {"_id": 0, "id": 1}):
+        property_id = prop["id"]
+        summary["properties_scanned"] += 1
+
+        # Tenants with an approved payment in this period
+        paid = await db.payments.aggregate([
+            {"$match": {
+                "property_id": property_id,
+                "status": "approved",
+                "payment_date": timestamp_prefilter(period_start, "$gte"),
+                "$expr": {"$gte": [timestamp_expr("payment_date"), period_start]}
+            }},
+            {"$group": {"_id": "$tenant_id"}}
+        ]).to_list(None)
+        paid_tenant_ids = {p["_id"] for p in paid}
+
+        ops = []
+        cursor = db.tenants.find(
+            {
+                "property_id": property_id,
+                "payment_status": {"$in": ["unpaid", "paid"]},
+                "check_in_date": timestamp_prefilter(period_start, "$lt"),
+                "$expr": {"$lt": [timestamp_expr("check_in_date"), period_start]}
+            },
+            {"_id": 0, "id": 1, "payment_status": 1, "check_out_date": 1}
+        ).batch_size(OVERDUE_BATCH_SIZE)
+        async for tenant in cursor:
+            summary["tenants_scanned"] += 1
+            if tenant["id"] in paid_tenant_ids:
+                continue
+            if tenant.get("check_out_date") and parse_timestamp(tenant["check_out_date"]) < now:
+                continue
+            ops.append(UpdateOne(
+                {"id": tenant["id"], "payment_status": tenant["payment_status"]},
+                {"$set": {"payment_status": "overdue", "overdue_since": now.isoformat()}}
+            ))
+            if len(ops) >= OVERDUE_BATCH_SIZE:
+                result = await db.tenants.bulk_write(ops, ordered=False)
+                summary["tenants_marked_overdue"] += result.modified_count
+                ops = []
+                await asyncio.sleep(OVERDUE_BATCH_PAUSE_SECONDS)
+        if ops:
+            result = await db.tenants.bulk_write(ops, ordered=False)
+            summary["tenants_marked_overdue"] += result.modified_count
+        await asyncio.sleep(OVERDUE_BATCH_PAUSE_SECONDS)
+
+    return summary
+
+# Archival
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", str(24 * 3600)))
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "12"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_BATCH_PAUSE_SECONDS = float(os.getenv("ARCHIVE_BATCH_PAUSE_SECONDS", "0.2"))
+
+# Archived collection -> date field that decides its period
+ARCHIVED_COLLECTIONS = {
+    "payments": "payment_date",
+    "canteen_transactions": "transaction_date",
+}
+
+def archive_collection_name(collection: str, year: int) -> str:
+    return f"{collection}_archive_{year}"
+
+def archive_cutoff() -> datetime:
+    # Start of the oldest month that still stays in the hot collections
+    now = datetime.now(timezone.utc)
+    months = now.year * 12 + now.month - 1 - ARCHIVE_AFTER_MONTHS
+    return datetime(months // 12, months % 12 + 1, 1, tzinfo=timezone.utc)
+
+def document_year(value) -> int:
+    return int(value[:4]) if isinstance(value, str) else value.year
+
+def archive_totals_cover(start: Optional[datetime], end: Optional[datetime]) -> bool:
+    # With no start and an end past the cutoff, every archived row is in range, so the
+    # pre-summed archive_totals stand in for the archives and reads stay on the hot data
+    return start is None and (end is None or parse_timestamp(end) > archive_cutoff())
+
+async def archive_years(collection: str, start: Optional[datetime], end: Optional[datetime]) -> List[int]:
+    # Archives are only scanned for ranges that explicitly reach before the cutoff
+    if archive_totals_cover(start, end):
+        return []
+    if start is not None and parse_timestamp(start) >= archive_cutoff():
+        return []
+    # end is exclusive, so 1 January does not pull in that year's archive
+    last_year = (end - timedelta(microseconds=1)).year if end else None
+    catalog = await db.archive_catalog.find({"collection": collection}, {"_id": 0, "year": 1}).to_list(None)
+    return sorted(
+        entry["year"] for entry in catalog
+        if (start is None or entry["year"] >= start.year) and (last_year is None or entry["year"] <= last_year)
+    )
+
+async def aggregate_with_history(collection: str, match: dict, start: Optional[datetime],
+                                 end: Optional[datetime], stages: List[dict]):
+    date_field = ARCHIVED_COLLECTIONS[collection]
+    match = dict(match)
+    date_range = {}
+    if start:
+        date_range["$gte"] = start.isoformat()
+    if end:
+        date_range["$lt"] = end.isoformat()
+    if date_range:
+        match[date_field] = date_range
+
+    pipeline = [{"$match": match}]
+    for year in await archive_years(collection, start, end):
+        pipeline.append({"$unionWith": {
+            "coll": archive_collection_name(collection, year),
+            "pipeline": [{"$match": match}]
+        }})
+    return db[collection].aggregate(pipeline + stages)
+
+async def register_archive_year(collection: str, year: int):
+    # dirty stays set until the year's archive_totals are recomputed, so a run that stops
+    # between moving rows and refreshing totals is caught up by the next one
+    result = await db.archive_catalog.update_one(
+        {"_id": f"{collection}:{year}"},
+        {"$setOnInsert": {"collection": collection, "year": year}, "$set": {"dirty": True}},
+        upsert=True
+    )
+    if result.upserted_id is not None:
+        await db[archive_collection_name(collection, year)].create_index(
+            [("property_id", 1), (ARCHIVED_COLLECTIONS[collection], 1)]
+        )
+
+async def refresh_archived_payment_totals(year: int):
+    totals = await db[archive_collection_name("payments", year)].aggregate([
+        {"$match": {"status": "approved"}},
+        {"$group": {"_id": "$property_id", "total": {"$sum": "$amount"}}}
+    ]).to_list(None)
+    for total in totals:
+        await db.archive_totals.update_one(
+            {"_id": f"payments:{year}:{total['_id']}"},
+            {"$set": {
+                "collection": "payments",
+                "year": year,
+                "property_id": total["_id"],
+                "approved_amount": total["total"]
+            }},
+            upsert=True
+        )
+
+async def refresh_archived_canteen_totals(year: int):
+    totals = await db[archive_collection_name("canteen_transactions", year)].aggregate([
+        {"$group": {
+            "_id": {"property_id": "$property_id", "product_id": "$product_id"},
+            "quantity": {"$sum": "$quantity"},
+            "revenue": {"$sum": "$total_price"},
+            "transactions": {"$sum": 1}
+        }}
+    ]).to_list(None)
+    for total in totals:
+        key = total["_id"]
+        await db.archive_totals.update_one(
+            {"_id": f"canteen_transactions:{year}:{key['property_id']}:{key['product_id']}"},
+            {"$set": {
+                "collection": "canteen_transactions",
+                "year": year,
+                "property_id": key["property_id"],
+                "product_id": key["product_id"],
+                "quantity": total["quantity"],
+                "revenue": total["revenue"],
+                "transactions": total["transactions"]
+            }},
+            upsert=True
+        )
+
+ARCHIVE_TOTALS_REFRESHERS = {
+    "payments": refresh_archived_payment_totals,
+    "canteen_transactions": refresh_archived_canteen_totals,
+}
+
+async def refresh_archive_year(collection: str, year: int):
+    await ARCHIVE_TOTALS_REFRESHERS[collection](year)
+    await db.archive_catalog.update_one({"_id": f"{collection}:{year}"}, {"$set": {"dirty": False}})
+
+async def archive_collection(collection: str, closed_filter: dict, cutoff: datetime):
+    date_field = ARCHIVED_COLLECTIONS[collection]
+    query = {**closed_filter, date_field: {"$lt": cutoff.isoformat()}}
+    moved = 0
+    years = set()
+    while True:
+        batch = await db[collection].find(query).sort(date_field, 1).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+        if not batch:
+            return moved, years
+
+        by_year = {}
+        for doc in batch:
+            by_year.setdefault(document_year(doc[date_field]), []).append(doc)
+        for year, docs in by_year.items():
+            await register_archive_year(collection, year)
+            try:
+                await db[archive_collection_name(collection, year)].insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                # A previous run copied part of this batch before stopping; _id keeps it idempotent
+                if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+            years.add(year)
+
+        # Only remove from the hot collection once the copy is in place, then bring the
+        # totals up to date right away so dashboards never miss the moved rows for long
+        await db[collection].delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        for year in by_year:
+            await refresh_archive_year(collection, year)
+        moved += len(batch)
+        await asyncio.sleep(ARCHIVE_BATCH_PAUSE_SECONDS)
+
+async def archive_closed_periods():
+    cutoff = archive_cutoff()
+    # Years left dirty by an interrupted run would otherwise never be refreshed again
+    async for entry in db.archive_catalog.find({"dirty": True}, {"_id": 0, "collection": 1, "year": 1}):
+        await refresh_archive_year(entry["collection"], entry["year"])
+    payments_moved, payment_years = await archive_collection("payments", {"status": {"$in": ["approved", "rejected"]}}, cutoff)
+    canteen_moved, canteen_years = await archive_collection("canteen_transactions", {}, cutoff)
+    return {
+        "cutoff": cutoff.isoformat(),
+        "payments_archived": payments_moved,
+        "payments_years": sorted(payment_years),
+        "canteen_transactions_archived": canteen_moved,
+        "canteen_transactions_years": sorted(canteen_years)
+    }
+
 app.include_router(api_router)
 
+app.add_middleware(ContentNegotiationMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -862,6 +2269,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_background_jobs():
+    await db.tenants.create_index([("property_id", 1), ("payment_status", 1)])
+    await db.rooms.create_index([("property_id", 1), ("status", 1), ("price", 1)])
+    await db.rooms.create_index([("property_id", 1), ("facilities", 1), ("price", 1)])
+    await db.rooms.create_index([("property_id", 1), ("room_type", 1), ("price", 1)])
+    await db.tenants.create_index("id")
+    await db.payments.create_index([("property_id", 1), ("status", 1), ("payment_date", 1)])
+    await db.payments.create_index("payment_date")
+    await db.archive_totals.create_index([("collection", 1), ("property_id", 1)])
+    await db.canteen_transactions.create_index([("property_id", 1), ("transaction_date", 1)])
+    await db.canteen_transactions.create_index("transaction_date")
+    await db.job_runs.create_index([("job", 1), ("started_at", -1)])
+    await db.activity_logs.create_index([("property_id", 1), ("created_at", -1), ("id", -1)])
+    await db.report_jobs.create_index([("property_id", 1), ("month", 1), ("format", 1), ("created_at", -1)])
+    await db.report_jobs.create_index(
+        [("property_id", 1), ("month", 1), ("format", 1)],
+        unique=True, partialFilterExpression={"active": True}
+    )
+    await db.report_jobs.create_index("heartbeat_at", partialFilterExpression={"active": True})
+    await db.report_jobs.create_index("id")
+    await db.activity_logs.create_index("created_at", expireAfterSeconds=ACTIVITY_LOG_TTL_DAYS * 24 * 3600)
+    await db.statement_cache.create_index("created_at", expireAfterSeconds=STATEMENT_CACHE_TTL_DAYS * 24 * 3600)
+    await db.statement_cache.create_index("tenant_id")
+    await db.room_prices.create_index([("room_id", 1), ("effective_from", 1)])
+    await db.utility_meters.create_index([("room_id", 1), ("reading_date", 1)])
+    await db.canteen_transactions.create_index([("tenant_id", 1), ("transaction_date", 1)])
+    await db.payments.create_index([("tenant_id", 1), ("status", 1), ("payment_date", 1)])
+    activity_writer.append(asyncio.create_task(run_activity_writer()))
+    await fail_expired_report_jobs()
+    if ENABLE_SCHEDULER:
+        scheduled_tasks.append(asyncio.create_task(
+            run_periodic_job("overdue_rent", OVERDUE_SCAN_INTERVAL_SECONDS, mark_overdue_tenants)
+        ))
+        scheduled_tasks.append(asyncio.create_task(
+            run_periodic_job("archive_history", ARCHIVE_INTERVAL_SECONDS, archive_closed_periods)
+        ))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in scheduled_tasks:
+        task.cancel()
+    await asyncio.gather(*scheduled_tasks, return_exceptions=True)
+    for writer in activity_writer:
+        await stop_activity_writer(writer)
+    if report_pool is not None:
+        report_pool.shutdown(wait=False, cancel_futures=True)
     client.close()
\ No newline at end of file
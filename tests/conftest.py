@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# server.py reads these at import time; the Motor client only connects on first query
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "managekost_test")
+os.environ.setdefault("ENABLE_SCHEDULER", "false")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
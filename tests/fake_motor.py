@@ -0,0 +1,357 @@
+"""In-memory stand-in for the Motor collections server.py uses.
+
+Supports only the query and pipeline features the tested code paths need.
+Patch it in with ``monkeypatch.setattr(server, "db", FakeDatabase())``.
+"""
+import copy
+import itertools
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+_object_ids = itertools.count(1)
+
+
+def _get(doc, path):
+    for part in path.split("."):
+        if isinstance(doc, list):
+            doc = [item.get(part) for item in doc if isinstance(item, dict)]
+        elif isinstance(doc, dict):
+            doc = doc.get(part)
+        else:
+            return None
+    return doc
+
+
+def _matches_condition(value, condition):
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            if operator == "$in" and value not in operand:
+                return False
+            if operator == "$lt" and not (value is not None and value < operand):
+                return False
+            if operator == "$lte" and not (value is not None and value <= operand):
+                return False
+            if operator == "$gt" and not (value is not None and value > operand):
+                return False
+            if operator == "$gte" and not (value is not None and value >= operand):
+                return False
+            if operator == "$exists" and (value is not None) != operand:
+                return False
+            if operator == "$ne" and value == operand:
+                return False
+            if operator == "$all" and not (isinstance(value, list) and all(item in value for item in operand)):
+                return False
+        return True
+    return value == condition
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub_query) for sub_query in condition):
+                return False
+        elif not _matches_condition(_get(doc, key), condition):
+            return False
+    return True
+
+
+def _evaluate(doc, expression):
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get(doc, expression[1:])
+    if isinstance(expression, dict):
+        if "$literal" in expression:
+            return expression["$literal"]
+        if "$arrayElemAt" in expression:
+            values, index = (_evaluate(doc, operand) for operand in expression["$arrayElemAt"])
+            return values[index] if values and -len(values) <= index < len(values) else None
+        if "$subtract" in expression:
+            minuend, subtrahend = (_evaluate(doc, operand) for operand in expression["$subtract"])
+            return minuend - subtrahend
+        if "$multiply" in expression:
+            result = 1
+            for factor in expression["$multiply"]:
+                result *= _evaluate(doc, factor)
+            return result
+        return {key: _evaluate(doc, value) for key, value in expression.items()}
+    return expression
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    projection = dict(projection)
+    include_id = projection.pop("_id", 1)
+    if any(projection.values()):
+        result = {key: copy.deepcopy(doc[key]) for key, keep in projection.items() if keep and key in doc}
+    else:
+        result = {key: copy.deepcopy(value) for key, value in doc.items() if projection.get(key, 1)}
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    elif not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def _sort(docs, spec):
+    for key, direction in reversed(spec):
+        docs.sort(key=lambda doc: (_get(doc, key) is not None, _get(doc, key)), reverse=direction < 0)
+    return docs
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        _sort(self.docs, key if isinstance(key, list) else [(key, direction)])
+        return self
+
+    def skip(self, count):
+        self.docs = self.docs[count:]
+        return self
+
+    def limit(self, count):
+        if count:
+            self.docs = self.docs[:count]
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs if length is None else self.docs[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class UpdateResult:
+    def __init__(self, matched_count=0, modified_count=0, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+
+
+class DeleteResult:
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+
+
+class FakeCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.docs = []
+        self.indexes = []
+        self.find_calls = 0
+
+    async def create_index(self, keys, **kwargs):
+        self.indexes.append((keys, kwargs))
+
+    def _duplicates(self, doc):
+        if any(existing.get("_id") == doc["_id"] for existing in self.docs):
+            return True
+        for keys, options in self.indexes:
+            if not options.get("unique"):
+                continue
+            partial = options.get("partialFilterExpression", {})
+            fields = [key for key, _ in keys] if isinstance(keys, list) else [keys]
+            if matches(doc, partial) and any(
+                matches(existing, partial) and all(_get(existing, field) == _get(doc, field) for field in fields)
+                for existing in self.docs
+            ):
+                return True
+        return False
+
+    async def insert_one(self, doc):
+        try:
+            await self.insert_many([doc])
+        except BulkWriteError as e:
+            raise DuplicateKeyError(e.details["writeErrors"][0]["errmsg"], 11000)
+
+    async def insert_many(self, docs, ordered=True):
+        write_errors = []
+        for index, doc in enumerate(docs):
+            doc.setdefault("_id", next(_object_ids))
+            if self._duplicates(doc):
+                write_errors.append({"index": index, "code": 11000, "errmsg": "duplicate key"})
+                if ordered:
+                    break
+                continue
+            self.docs.append(copy.deepcopy(doc))
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "nInserted": len(docs) - len(write_errors)})
+
+    def find(self, query=None, projection=None):
+        self.find_calls += 1
+        return FakeCursor([_project(doc, projection) for doc in self.docs if matches(doc, query or {})])
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        cursor = self.find(query, projection)
+        if sort:
+            cursor.sort(sort)
+        docs = await cursor.to_list(1)
+        return docs[0] if docs else None
+
+    async def distinct(self, key, query=None):
+        values = []
+        for doc in self.docs:
+            if matches(doc, query or {}) and _get(doc, key) not in values:
+                values.append(_get(doc, key))
+        return values
+
+    async def count_documents(self, query):
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    @staticmethod
+    def _apply(doc, update):
+        doc.update(copy.deepcopy(update.get("$set", {})))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+
+    async def update_one(self, query, update, upsert=False):
+        for doc in self.docs:
+            if matches(doc, query):
+                self._apply(doc, update)
+                return UpdateResult(matched_count=1, modified_count=1)
+        if not upsert:
+            return UpdateResult()
+        doc = {key: value for key, value in query.items() if not key.startswith("$")}
+        doc.update(copy.deepcopy(update.get("$setOnInsert", {})))
+        doc.update(copy.deepcopy(update.get("$set", {})))
+        doc.setdefault("_id", next(_object_ids))
+        self.docs.append(doc)
+        return UpdateResult(upserted_id=doc["_id"])
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False):
+        # Returns the document as it was before the update, like pymongo's default
+        for doc in self.docs:
+            if matches(doc, query):
+                before = _project(doc, projection)
+                self._apply(doc, update)
+                return before
+        return None
+
+    async def update_many(self, query, update):
+        matched = [doc for doc in self.docs if matches(doc, query)]
+        for doc in matched:
+            self._apply(doc, update)
+        return UpdateResult(matched_count=len(matched), modified_count=len(matched))
+
+    async def delete_many(self, query):
+        kept = [doc for doc in self.docs if not matches(doc, query)]
+        deleted = len(self.docs) - len(kept)
+        self.docs = kept
+        return DeleteResult(deleted)
+
+    def aggregate(self, pipeline, **kwargs):
+        return FakeCursor(self.database.run_pipeline(copy.deepcopy(self.docs), pipeline))
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+        self.pipelines = []
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self, name)
+        return self.collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def run_pipeline(self, docs, pipeline):
+        self.pipelines.append(pipeline)
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$match":
+                docs = [doc for doc in docs if matches(doc, spec)]
+            elif operator == "$unionWith":
+                docs = docs + self.run_pipeline(copy.deepcopy(self[spec["coll"]].docs), spec.get("pipeline", []))
+            elif operator == "$group":
+                docs = self._group(docs, spec)
+            elif operator == "$sort":
+                docs = _sort(docs, list(spec.items()))
+            elif operator == "$project" and all(expression == 0 for expression in spec.values()):
+                docs = [{field: value for field, value in doc.items() if field not in spec} for doc in docs]
+            elif operator == "$project":
+                docs = [
+                    {
+                        field: _get(doc, field) if expression == 1 else _evaluate(doc, expression)
+                        for field, expression in {"_id": 1, **spec}.items() if expression != 0
+                    }
+                    for doc in docs
+                ]
+            elif operator == "$lookup":
+                foreign = self[spec["from"]].docs
+                for doc in docs:
+                    doc[spec["as"]] = [
+                        copy.deepcopy(other) for other in foreign
+                        if _get(other, spec["foreignField"]) == _get(doc, spec["localField"])
+                    ]
+            elif operator == "$limit":
+                docs = docs[:spec]
+            elif operator == "$skip":
+                docs = docs[spec:]
+            elif operator == "$count":
+                docs = [{spec: len(docs)}] if docs else []
+            elif operator == "$bucket":
+                docs = self._bucket(docs, spec)
+            elif operator == "$facet":
+                docs = [{name: self.run_pipeline(copy.deepcopy(docs), sub) for name, sub in spec.items()}]
+            else:
+                raise NotImplementedError(operator)
+        return docs
+
+    @staticmethod
+    def _bucket(docs, spec):
+        if spec.get("output", {"count": {"$sum": 1}}) != {"count": {"$sum": 1}}:
+            raise NotImplementedError("$bucket output")
+        boundaries = spec["boundaries"]
+        buckets = {}
+        for doc in docs:
+            value = _evaluate(doc, spec["groupBy"])
+            key = spec["default"]
+            if isinstance(value, (int, float)):
+                for lower, upper in zip(boundaries, boundaries[1:]):
+                    if lower <= value < upper:
+                        key = lower
+                        break
+            bucket = buckets.setdefault(key, {"_id": key, "count": 0})
+            bucket["count"] += 1
+        # Boundary buckets come first in order, then the default, like MongoDB
+        ordered = [buckets[lower] for lower in boundaries if lower in buckets]
+        return ordered + ([buckets[spec["default"]]] if spec["default"] in buckets else [])
+
+    @staticmethod
+    def _group(docs, spec):
+        groups = {}
+        for doc in docs:
+            key = _evaluate(doc, spec["_id"])
+            group_key = repr(key)
+            group = groups.setdefault(group_key, {"_id": key, **{field: 0 for field in spec if field != "_id"}})
+            for field, accumulator in spec.items():
+                if field == "_id":
+                    continue
+                (operator, expression), = accumulator.items()
+                if operator == "$sum":
+                    group[field] += _evaluate(doc, expression) or 0
+                elif operator == "$addToSet":
+                    if not group[field]:
+                        group[field] = []
+                    value = _evaluate(doc, expression)
+                    if value not in group[field]:
+                        group[field].append(value)
+                else:
+                    raise NotImplementedError(operator)
+        return list(groups.values())
@@ -0,0 +1,231 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+import server
+from tests.fake_motor import FakeDatabase
+
+CUTOFF = datetime(2025, 1, 1, tzinfo=timezone.utc)
+OWNER = {"id": "owner-1", "role": "owner"}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "archive_cutoff", lambda: CUTOFF)
+    monkeypatch.setattr(server, "ARCHIVE_BATCH_SIZE", 2)
+    monkeypatch.setattr(server, "ARCHIVE_BATCH_PAUSE_SECONDS", 0)
+    return database
+
+
+def payment(payment_id, date, amount, status="approved", property_id="p1"):
+    return {
+        "id": payment_id,
+        "tenant_id": "t1",
+        "property_id": property_id,
+        "room_id": "r1",
+        "amount": amount,
+        "payment_date": date,
+        "status": status,
+    }
+
+
+def sale(sale_id, date, product_id, quantity, total_price, property_id="p1"):
+    return {
+        "id": sale_id,
+        "property_id": property_id,
+        "product_id": product_id,
+        "tenant_id": "t1",
+        "quantity": quantity,
+        "total_price": total_price,
+        "transaction_date": date,
+    }
+
+
+def seed_payments(db):
+    db.payments.docs.extend([
+        payment("a", "2022-02-01T00:00:00+00:00", 100),
+        payment("b", "2022-03-01T00:00:00+00:00", 200),
+        payment("c", "2022-11-01T00:00:00+00:00", 300, status="rejected"),
+        payment("d", "2023-01-05T00:00:00+00:00", 400),
+        payment("e", "2023-06-01T00:00:00+00:00", 500, property_id="p2"),
+        payment("old-pending", "2022-05-01T00:00:00+00:00", 50, status="pending"),
+        payment("recent", "2026-09-01T00:00:00+00:00", 1000),
+    ])
+    for index, doc in enumerate(db.payments.docs):
+        doc["_id"] = f"oid-{index}"
+
+
+def seed_sales(db):
+    db.canteen_transactions.docs.extend([
+        sale("s1", "2022-04-01T00:00:00+00:00", "tea", 2, 10),
+        sale("s2", "2023-04-01T00:00:00+00:00", "tea", 3, 15),
+        sale("s3", "2023-05-01T00:00:00+00:00", "noodle", 1, 12),
+        sale("s4", "2026-09-02T00:00:00+00:00", "noodle", 4, 48),
+    ])
+    for index, doc in enumerate(db.canteen_transactions.docs):
+        doc["_id"] = f"sale-oid-{index}"
+
+
+def ids(collection):
+    return sorted(doc["id"] for doc in collection.docs)
+
+
+def test_archive_splits_closed_rows_per_year_in_batches(db):
+    seed_payments(db)
+
+    summary = asyncio.run(server.archive_closed_periods())
+
+    assert summary["payments_archived"] == 5
+    assert summary["payments_years"] == [2022, 2023]
+    assert ids(db.payments_archive_2022) == ["a", "b", "c"]
+    assert ids(db.payments_archive_2023) == ["d", "e"]
+    # Pending and recent payments stay hot
+    assert ids(db.payments) == ["old-pending", "recent"]
+    # Five rows at two per batch: three batches plus the empty read that ends the loop
+    assert db.payments.find_calls == 4
+    assert sorted(doc["_id"] for doc in db.archive_catalog.docs) == ["payments:2022", "payments:2023"]
+    assert db.payments_archive_2022.indexes == [([("property_id", 1), ("payment_date", 1)], {})]
+
+
+def test_archive_rerun_after_partial_copy_does_not_duplicate(db):
+    seed_payments(db)
+    # A previous run copied "a" and stopped before deleting it from the hot collection
+    already_copied = dict(next(doc for doc in db.payments.docs if doc["id"] == "a"))
+    db.payments_archive_2022.docs.append(already_copied)
+
+    asyncio.run(server.archive_closed_periods())
+
+    assert ids(db.payments_archive_2022) == ["a", "b", "c"]
+    assert ids(db.payments) == ["old-pending", "recent"]
+
+
+def test_archive_keeps_hot_rows_when_copy_fails(db, monkeypatch):
+    seed_payments(db)
+
+    async def failing_insert(docs, ordered=True):
+        raise BulkWriteError({"writeErrors": [{"index": 0, "code": 121, "errmsg": "validation failed"}]})
+
+    monkeypatch.setattr(db.payments_archive_2022, "insert_many", failing_insert)
+
+    with pytest.raises(BulkWriteError):
+        asyncio.run(server.archive_closed_periods())
+    assert len(db.payments.docs) == 7
+
+
+def test_refresh_archived_payment_totals_sums_approved_per_property(db):
+    seed_payments(db)
+
+    asyncio.run(server.archive_closed_periods())
+
+    totals = {doc["_id"]: doc["approved_amount"] for doc in db.archive_totals.docs if doc["collection"] == "payments"}
+    assert totals == {"payments:2022:p1": 300, "payments:2023:p1": 400, "payments:2023:p2": 500}
+
+
+def test_refresh_archived_payment_totals_is_idempotent(db):
+    seed_payments(db)
+    asyncio.run(server.archive_closed_periods())
+
+    asyncio.run(server.refresh_archived_payment_totals(2022))
+
+    assert [doc["approved_amount"] for doc in db.archive_totals.docs if doc["_id"] == "payments:2022:p1"] == [300]
+
+
+def test_dashboard_revenue_is_unchanged_by_archiving(db):
+    seed_payments(db)
+    before_all = asyncio.run(server.get_dashboard_stats(None, OWNER))["total_revenue"]
+    before_p1 = asyncio.run(server.get_dashboard_stats("p1", OWNER))["total_revenue"]
+
+    asyncio.run(server.archive_closed_periods())
+    db.pipelines.clear()
+
+    assert asyncio.run(server.get_dashboard_stats(None, OWNER))["total_revenue"] == before_all == 2200
+    assert asyncio.run(server.get_dashboard_stats("p1", OWNER))["total_revenue"] == before_p1 == 1700
+    assert not any("$unionWith" in stage for pipeline in db.pipelines for stage in pipeline)
+
+
+def test_sales_report_without_range_reads_only_hot_data(db):
+    seed_sales(db)
+    before = asyncio.run(server.get_canteen_sales_report("p1", None, None, OWNER))
+
+    asyncio.run(server.archive_closed_periods())
+    db.pipelines.clear()
+    after = asyncio.run(server.get_canteen_sales_report("p1", None, None, OWNER))
+
+    assert after == before
+    assert after["total_revenue"] == 85
+    assert after["total_transactions"] == 4
+    assert [product["_id"] for product in after["top_products"]] == ["noodle", "tea"]
+    assert not any("$unionWith" in stage for pipeline in db.pipelines for stage in pipeline)
+
+
+def test_sales_report_historical_range_unions_archives(db):
+    seed_sales(db)
+    asyncio.run(server.archive_closed_periods())
+    db.pipelines.clear()
+
+    report = asyncio.run(server.get_canteen_sales_report(
+        "p1", datetime(2023, 1, 1, tzinfo=timezone.utc), datetime(2024, 1, 1, tzinfo=timezone.utc), OWNER
+    ))
+
+    assert report["total_revenue"] == 27
+    assert report["total_transactions"] == 2
+    unions = [stage["$unionWith"]["coll"] for stage in db.pipelines[0] if "$unionWith" in stage]
+    assert unions == ["canteen_transactions_archive_2023"]
+
+
+def test_archive_years_treats_end_as_exclusive(db):
+    db.archive_catalog.docs.extend([
+        {"_id": "payments:2022", "collection": "payments", "year": 2022},
+        {"_id": "payments:2023", "collection": "payments", "year": 2023},
+    ])
+
+    years = asyncio.run(server.archive_years(
+        "payments", datetime(2022, 6, 1, tzinfo=timezone.utc), datetime(2023, 1, 1, tzinfo=timezone.utc)
+    ))
+
+    assert years == [2022]
+
+
+def test_archive_years_skips_archives_for_recent_or_open_ranges(db):
+    db.archive_catalog.docs.append({"_id": "payments:2022", "collection": "payments", "year": 2022})
+
+    assert asyncio.run(server.archive_years("payments", None, None)) == []
+    assert asyncio.run(server.archive_years("payments", datetime(2025, 3, 1, tzinfo=timezone.utc), None)) == []
+
+
+def test_totals_are_refreshed_after_each_batch(db, monkeypatch):
+    seed_payments(db)
+    before = asyncio.run(server.get_dashboard_stats("p1", OWNER))["total_revenue"]
+    find = db.payments.find
+
+    def find_then_fail(*args, **kwargs):
+        # The first batch moves "a" and "b", then the next read hits a transient error
+        if db.payments.find_calls == 1:
+            raise RuntimeError("connection reset")
+        return find(*args, **kwargs)
+
+    monkeypatch.setattr(db.payments, "find", find_then_fail)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(server.archive_closed_periods())
+
+    assert ids(db.payments_archive_2022) == ["a", "b"]
+    assert asyncio.run(server.get_dashboard_stats("p1", OWNER))["total_revenue"] == before
+
+
+def test_dirty_years_are_refreshed_on_the_next_run(db):
+    # A previous run moved these rows and stopped before their totals were written
+    db.archive_catalog.docs.append({"_id": "payments:2022", "collection": "payments", "year": 2022, "dirty": True})
+    db.payments_archive_2022.docs.extend([
+        payment("a", "2022-02-01T00:00:00+00:00", 100),
+        payment("b", "2022-03-01T00:00:00+00:00", 200),
+    ])
+
+    asyncio.run(server.archive_closed_periods())
+
+    assert [(doc["_id"], doc["approved_amount"]) for doc in db.archive_totals.docs] == [("payments:2022:p1", 300)]
+    assert db.archive_catalog.docs[0]["dirty"] is False
@@ -0,0 +1,63 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from tests.fake_motor import FakeDatabase
+
+OWNER = {"id": "owner-1", "role": "owner"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    database = FakeDatabase()
+    database.properties.docs.append({
+        "id": "p1", "owner_id": "owner-1", "name": "Kos Melati", "address": "Jl. Melati 1",
+        "total_rooms": 4, "created_at": "2026-01-01T00:00:00+00:00",
+    })
+    database.rooms.docs.append({"id": "r1", "property_id": "p1", "status": "available"})
+    monkeypatch.setattr(server, "db", database)
+    server.app.dependency_overrides[server.get_current_user] = lambda: OWNER
+    yield TestClient(server.app, raise_server_exceptions=False)
+    server.app.dependency_overrides.clear()
+
+
+def batch(client, *paths):
+    response = client.post(
+        "/api/batch",
+        json={"requests": [{"id": str(index), "path": path} for index, path in enumerate(paths)]},
+        headers={"Authorization": "Bearer test"},
+    )
+    assert response.status_code == 200
+    return {item["id"]: item for item in response.json()["responses"]}
+
+
+def test_batch_returns_each_sub_response(client):
+    responses = batch(client, "/api/properties", "/api/properties/missing")
+
+    assert responses["0"]["status"] == 200
+    assert [prop["id"] for prop in responses["0"]["body"]] == ["p1"]
+    assert responses["1"] == {"id": "1", "status": 404, "body": {"detail": "Property not found"}}
+
+
+def test_failing_sub_request_does_not_fail_the_batch(client, monkeypatch):
+    def broken_find(*args, **kwargs):
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(server.db.rooms, "find", broken_find)
+
+    responses = batch(client, "/api/properties", "/api/rooms")
+
+    assert responses["0"]["status"] == 200
+    assert responses["0"]["body"][0]["name"] == "Kos Melati"
+    assert responses["1"] == {"id": "1", "status": 500, "body": {"detail": "connection reset"}}
+
+
+def test_batch_rejects_non_get_and_nested_batches(client):
+    response = client.post(
+        "/api/batch",
+        json={"requests": [{"id": "a", "method": "POST", "path": "/api/properties"}, {"id": "b", "path": "/api/batch"}]},
+        headers={"Authorization": "Bearer test"},
+    )
+
+    statuses = {item["id"]: item["status"] for item in response.json()["responses"]}
+    assert statuses == {"a": 405, "b": 400}
@@ -0,0 +1,126 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+import server
+
+needs_msgpack = pytest.mark.skipif(server.msgpack is None, reason="msgpack is not installed")
+needs_brotli = pytest.mark.skipif(server.brotli is None, reason="brotli is not installed")
+
+ROWS = [{"id": index, "room_number": f"{100 + index}", "status": "available"} for index in range(100)]
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.get("/small", response_class=server.NegotiatedResponse)
+    async def small():
+        return {"ok": True}
+
+    @app.get("/large", response_class=server.NegotiatedResponse)
+    async def large():
+        return ROWS
+
+    @app.get("/image")
+    async def image():
+        return Response(b"\x89PNG" + b"\x00" * 4096, media_type="image/png")
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            yield b'{"part": 1}' * 200
+            yield b'{"part": 2}' * 200
+
+        return StreamingResponse(chunks(), media_type="application/json")
+
+    app.add_middleware(server.ContentNegotiationMiddleware, minimum_size=1024)
+    return TestClient(app)
+
+
+def get(client, path, accept="application/json", accept_encoding="identity"):
+    return client.get(path, headers={"Accept": accept, "Accept-Encoding": accept_encoding})
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("", "json"),
+    ("application/json", "json"),
+    ("application/x-msgpack", "msgpack"),
+    ("application/msgpack;q=0.9, application/json;q=0.5", "msgpack"),
+    ("application/json, application/x-msgpack;q=0", "json"),
+    ("application/x-msgpack, application/json", "json"),
+    ("application/x-msgpack, */*;q=0.1", "msgpack"),
+    ("application/x-msgpack;q=0.5, */*", "json"),
+])
+@needs_msgpack
+def test_choose_response_format_honours_q_values(accept, expected):
+    assert server.choose_response_format(accept) == expected
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, br", "br"),
+    ("gzip", "gzip"),
+    ("gzip, br;q=0", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("identity", None),
+])
+@needs_brotli
+def test_choose_content_encoding(accept_encoding, expected):
+    assert server.choose_content_encoding(accept_encoding) == expected
+
+
+@needs_msgpack
+def test_msgpack_body_when_requested(client):
+    response = get(client, "/large", accept="application/x-msgpack")
+
+    assert response.headers["content-type"] == "application/x-msgpack"
+    assert server.msgpack.unpackb(response.content) == ROWS
+    assert "Accept" in response.headers["vary"]
+
+
+def test_refused_msgpack_falls_back_to_json(client):
+    response = get(client, "/large", accept="application/json, application/x-msgpack;q=0")
+
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == ROWS
+
+
+def test_small_bodies_are_not_compressed(client):
+    response = get(client, "/small", accept_encoding="gzip")
+
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"ok": True}
+    assert "Accept-Encoding" in response.headers["vary"]
+
+
+@needs_brotli
+def test_large_bodies_prefer_brotli(client):
+    response = get(client, "/large", accept_encoding="gzip, br")
+
+    assert response.headers["content-encoding"] == "br"
+    assert response.json() == ROWS
+    assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_large_bodies_use_gzip_when_brotli_is_refused(client):
+    response = get(client, "/large", accept_encoding="gzip, br;q=0")
+
+    assert response.headers["content-encoding"] == "gzip"
+    # The client decodes the body; Content-Length is the compressed size on the wire
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json() == ROWS
+
+
+def test_incompressible_media_types_pass_through(client):
+    response = get(client, "/image", accept_encoding="gzip")
+
+    assert "content-encoding" not in response.headers
+    assert response.content.startswith(b"\x89PNG")
+
+
+def test_streaming_responses_pass_through(client):
+    response = get(client, "/stream", accept_encoding="gzip")
+
+    assert "content-encoding" not in response.headers
+    assert response.content == b'{"part": 1}' * 200 + b'{"part": 2}' * 200
@@ -0,0 +1,140 @@
+import asyncio
+import sqlite3
+
+import pytest
+from starlette.requests import Request
+
+import server
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_take_token_allows_until_bucket_is_empty():
+    tokens, retry_after = server.take_token(2, 0, 0, capacity=2, refill_per_second=1)
+    assert (tokens, retry_after) == (1, 0.0)
+    tokens, retry_after = server.take_token(tokens, 0, 0, capacity=2, refill_per_second=1)
+    assert (tokens, retry_after) == (0, 0.0)
+    tokens, retry_after = server.take_token(tokens, 0, 0, capacity=2, refill_per_second=1)
+    assert tokens == 0
+    assert retry_after == pytest.approx(1.0)
+
+
+def test_take_token_refills_but_never_above_capacity():
+    tokens, retry_after = server.take_token(0, 0, 1000, capacity=5, refill_per_second=0.5)
+    assert tokens == 4
+    assert retry_after == 0.0
+
+
+def test_take_token_retry_after_covers_missing_fraction():
+    tokens, retry_after = server.take_token(0, 0, 1, capacity=5, refill_per_second=0.25)
+    assert tokens == pytest.approx(0.25)
+    assert retry_after == pytest.approx(3.0)
+
+
+def test_memory_backend_blocks_then_recovers():
+    clock = FakeClock()
+    backend = server.MemoryRateLimitBackend(clock=clock)
+
+    async def run():
+        allowed = [await backend.consume("ip:1", 3, 1 / 60) for _ in range(3)]
+        blocked = await backend.consume("ip:1", 3, 1 / 60)
+        other_key = await backend.consume("ip:2", 3, 1 / 60)
+        clock.now += 60
+        recovered = await backend.consume("ip:1", 3, 1 / 60)
+        return allowed, blocked, other_key, recovered
+
+    allowed, blocked, other_key, recovered = asyncio.run(run())
+    assert allowed == [0.0, 0.0, 0.0]
+    assert blocked == pytest.approx(60.0)
+    assert other_key == 0.0
+    assert recovered == 0.0
+
+
+def test_memory_backend_evicts_oldest_keys():
+    backend = server.MemoryRateLimitBackend(max_keys=2, clock=FakeClock())
+
+    async def run():
+        for key in ("a", "b", "c"):
+            await backend.consume(key, 1, 1)
+
+    asyncio.run(run())
+    assert list(backend.buckets) == ["b", "c"]
+
+
+def test_sqlite_backend_shares_state_between_instances(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "rate_limit.sqlite3")
+    first = server.SqliteRateLimitBackend(path, clock=clock)
+    second = server.SqliteRateLimitBackend(path, clock=clock)
+
+    async def run():
+        await first.consume("email:a@b.com", 2, 1)
+        await second.consume("email:a@b.com", 2, 1)
+        return await first.consume("email:a@b.com", 2, 1)
+
+    assert asyncio.run(run()) == pytest.approx(1.0)
+
+
+def test_sqlite_backend_prunes_refilled_buckets(tmp_path):
+    clock = FakeClock()
+    backend = server.SqliteRateLimitBackend(str(tmp_path / "rate_limit.sqlite3"), clock=clock, prune_seconds=60)
+
+    async def run():
+        for i in range(50):
+            await backend.consume(f"email:user{i}@example.com", 5, 1)
+        # Every bucket is full again after 1s; the next call past the prune interval drops them
+        clock.now += 61
+        await backend.consume("email:new@example.com", 5, 1)
+
+    asyncio.run(run())
+    keys = [row[0] for row in backend.conn.execute("SELECT key FROM token_buckets")]
+    assert keys == ["email:new@example.com"]
+
+
+def test_sqlite_backend_falls_back_when_store_is_locked(tmp_path):
+    backend = server.SqliteRateLimitBackend(str(tmp_path / "rate_limit.sqlite3"), clock=FakeClock())
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    backend._consume = locked
+    backend.fallback.clock = FakeClock()
+    assert asyncio.run(backend.consume("ip:1", 1, 1)) == 0.0
+    assert asyncio.run(backend.consume("ip:1", 1, 1)) == pytest.approx(1.0)
+
+
+def forwarded_request(forwarded_for, peer="10.0.0.2"):
+    return Request({
+        "type": "http",
+        "headers": [(b"x-forwarded-for", forwarded_for.encode())],
+        "client": (peer, 5000),
+    })
+
+
+def test_client_ip_ignores_spoofed_forwarded_entries(monkeypatch):
+    monkeypatch.setattr(server, "RATE_LIMIT_TRUST_FORWARDED", True)
+    monkeypatch.setattr(server, "RATE_LIMIT_TRUSTED_PROXIES", 1)
+
+    # The client sent "1.2.3.4" itself; the proxy appended the address it saw
+    assert server.get_client_ip(forwarded_request("1.2.3.4, 203.0.113.7")) == "203.0.113.7"
+    assert server.get_client_ip(forwarded_request("9.9.9.9, 203.0.113.7")) == "203.0.113.7"
+
+
+def test_client_ip_skips_configured_proxy_hops(monkeypatch):
+    monkeypatch.setattr(server, "RATE_LIMIT_TRUST_FORWARDED", True)
+    monkeypatch.setattr(server, "RATE_LIMIT_TRUSTED_PROXIES", 2)
+
+    assert server.get_client_ip(forwarded_request("1.2.3.4, 203.0.113.7, 10.0.0.1")) == "203.0.113.7"
+    assert server.get_client_ip(forwarded_request("203.0.113.7")) == "203.0.113.7"
+
+
+def test_client_ip_uses_peer_when_forwarding_is_not_trusted(monkeypatch):
+    monkeypatch.setattr(server, "RATE_LIMIT_TRUST_FORWARDED", False)
+
+    assert server.get_client_ip(forwarded_request("1.2.3.4")) == "10.0.0.2"
@@ -0,0 +1,194 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import server
+from tests.fake_motor import FakeDatabase
+
+OWNER = {"id": "owner-1", "role": "owner"}
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
+END = datetime(2026, 4, 1, tzinfo=timezone.utc)
+PROPERTY = {"id": "p1", "name": "Kos Melati", "owner_id": "owner-1", "address": None}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "BUSINESS_TIMEZONE", ZoneInfo("Asia/Jakarta"))
+    database.properties.docs.append(dict(PROPERTY))
+    asyncio.run(database.report_jobs.create_index(
+        [("property_id", 1), ("month", 1), ("format", 1)],
+        unique=True, partialFilterExpression={"active": True}
+    ))
+    return database
+
+
+@pytest.fixture
+def no_rendering(monkeypatch):
+    started = []
+
+    async def record_job(job, prop, start, end):
+        started.append(job["id"])
+
+    monkeypatch.setattr(server, "run_report_job", record_job)
+    return started
+
+
+def tenant(tenant_id, room_id, check_in, check_out=None):
+    return {
+        "id": tenant_id,
+        "property_id": "p1",
+        "room_id": room_id,
+        "check_in_date": check_in,
+        "check_out_date": check_out,
+    }
+
+
+def request(month="2026-03", report_format="xlsx"):
+    return server.create_report_job(server.ReportJobCreate(property_id="p1", month=month, format=report_format), OWNER)
+
+
+def test_occupancy_counts_rooms_with_stays_in_the_month(db):
+    db.rooms.docs.extend([
+        {"id": "r1", "property_id": "p1", "status": "available"},
+        {"id": "r2", "property_id": "p1", "status": "occupied"},
+        {"id": "r3", "property_id": "p1", "status": "occupied"},
+        {"id": "r4", "property_id": "p1", "status": "available"},
+    ])
+    db.tenants.docs.extend([
+        # Two stays in r1 during March count it once; both moved out since
+        tenant("t1", "r1", "2026-01-01T00:00:00+00:00", "2026-03-10T00:00:00+00:00"),
+        tenant("t2", "r1", "2026-03-15T00:00:00+00:00", "2026-05-01T00:00:00+00:00"),
+        # Left before March and arrived after March
+        tenant("t3", "r2", "2025-10-01T00:00:00+00:00", "2026-02-20T00:00:00+00:00"),
+        tenant("t4", "r3", "2026-04-02T00:00:00+00:00"),
+        tenant("t5", "r4", "2026-02-01T00:00:00+00:00"),
+    ])
+
+    summary = asyncio.run(server.gather_monthly_report(PROPERTY, "2026-03", START, END))["summary"]
+
+    assert summary["total_rooms"] == 4
+    assert summary["occupied_rooms"] == 2
+    assert summary["occupancy_rate"] == 50.0
+    assert summary["active_tenants"] == 3
+
+
+def test_concurrent_identical_requests_share_one_job(db, no_rendering, monkeypatch):
+    find_one = db.report_jobs.find_one
+
+    async def find_one_then_yield(*args, **kwargs):
+        # Let the other request run its lookup before either one inserts
+        result = await find_one(*args, **kwargs)
+        await asyncio.sleep(0)
+        return result
+
+    monkeypatch.setattr(db.report_jobs, "find_one", find_one_then_yield)
+
+    async def both():
+        return await asyncio.gather(request(), request())
+
+    first, second = asyncio.run(both())
+
+    assert first["id"] == second["id"]
+    assert len(db.report_jobs.docs) == 1
+    assert no_rendering == [first["id"]]
+
+
+def active_job(job_id, heartbeat_age, **fields):
+    heartbeat_at = datetime.now(timezone.utc) - timedelta(seconds=heartbeat_age)
+    return {
+        "id": job_id, "property_id": "p1", "month": "2026-03", "format": "xlsx", "status": "running",
+        "active": True, "created_at": "2026-01-01T00:00:00+00:00", "heartbeat_at": heartbeat_at.isoformat(),
+        **fields,
+    }
+
+
+def test_abandoned_job_is_failed_and_replaced(db, no_rendering):
+    db.report_jobs.docs.append(active_job("stuck", server.REPORT_JOB_LEASE_SECONDS + 1))
+
+    job = asyncio.run(request())
+
+    assert job["id"] != "stuck"
+    stuck = next(doc for doc in db.report_jobs.docs if doc["id"] == "stuck")
+    assert stuck["status"] == "failed"
+    assert "active" not in stuck
+
+
+def test_long_running_job_with_a_live_heartbeat_is_reused(db, no_rendering):
+    db.report_jobs.docs.append(active_job("slow", 1))
+
+    job = asyncio.run(request())
+
+    assert job["id"] == "slow"
+    assert no_rendering == []
+
+
+def test_startup_fails_only_jobs_whose_lease_lapsed(db):
+    lapsed = server.REPORT_JOB_LEASE_SECONDS + 1
+    db.report_jobs.docs.extend([
+        active_job("dead-running", lapsed),
+        active_job("dead-queued", lapsed, status="queued", month="2026-04"),
+        # A sibling worker on the same host is still renewing this one
+        active_job("sibling", 1, month="2026-05", worker=server.WORKER_ID),
+        {"id": "finished", "status": "done", "heartbeat_at": "2026-01-01T00:00:00+00:00"},
+    ])
+
+    asyncio.run(server.fail_expired_report_jobs())
+
+    assert {doc["id"]: doc["status"] for doc in db.report_jobs.docs} == {
+        "dead-running": "failed", "dead-queued": "failed", "sibling": "running", "finished": "done",
+    }
+
+
+def test_running_job_renews_its_lease(db, monkeypatch):
+    monkeypatch.setattr(server, "REPORT_JOB_LEASE_SECONDS", 0.04)
+    db.report_jobs.docs.append(active_job("job", 60))
+    before = db.report_jobs.docs[0]["heartbeat_at"]
+
+    async def beat_once():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(server.keep_report_job_alive("job"), timeout=0.03)
+
+    asyncio.run(beat_once())
+
+    assert db.report_jobs.docs[0]["heartbeat_at"] > before
+
+
+def test_report_month_follows_the_business_timezone(db):
+    start, end = server.report_month_range("2026-09")
+
+    assert start == datetime(2026, 8, 31, 17, tzinfo=timezone.utc)
+    assert end == datetime(2026, 9, 30, 17, tzinfo=timezone.utc)
+
+
+def test_payment_early_on_the_first_belongs_to_the_new_month(db):
+    # 01:00 WIB on 1 October
+    db.payments.docs.append({
+        "id": "pay-1", "property_id": "p1", "tenant_id": "t1", "amount": 1000, "status": "approved",
+        "payment_method": "transfer", "payment_date": "2026-09-30T18:00:00+00:00",
+    })
+
+    september = asyncio.run(server.gather_monthly_report(PROPERTY, "2026-09", *server.report_month_range("2026-09")))
+    october = asyncio.run(server.gather_monthly_report(PROPERTY, "2026-10", *server.report_month_range("2026-10")))
+
+    assert september["payments"] == []
+    assert october["payments"] == [["2026-10-01", "-", "transfer", 1000]]
+
+
+def test_last_month_report_is_served_from_cache(db, no_rendering, tmp_path):
+    last_month = f"{server.billing_period_start(datetime.now(timezone.utc)) - timedelta(days=1):%Y-%m}"
+    artifact = tmp_path / "done.xlsx"
+    artifact.write_bytes(b"xlsx")
+    db.report_jobs.docs.append({
+        "id": "done", "property_id": "p1", "month": last_month, "format": "xlsx", "status": "done",
+        "file_path": str(artifact), "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+
+    job = asyncio.run(request(month=last_month))
+
+    assert job["id"] == "done"
+    assert job["download_url"] == "/api/reports/done/download"
+    assert no_rendering == []
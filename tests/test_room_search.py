@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from tests.fake_motor import FakeDatabase
+
+OWNER = {"id": "owner-1", "role": "owner"}
+
+
+def room(room_id, property_id, price, room_type="Standard", status="available", facilities=("WiFi",)):
+    return {
+        "id": room_id,
+        "property_id": property_id,
+        "room_number": room_id.upper(),
+        "room_type": room_type,
+        "price": price,
+        "status": status,
+        "facilities": list(facilities),
+    }
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(server, "db", database)
+    database.properties.docs.extend([
+        {"id": "p1", "owner_id": "owner-1", "name": "Kos Melati"},
+        {"id": "p2", "owner_id": "owner-1", "name": "Kos Mawar"},
+        {"id": "p3", "owner_id": "owner-2", "name": "Kos Lain"},
+    ])
+    database.rooms.docs.extend([
+        room("r1", "p1", 450000),
+        room("r2", "p1", 1200000, facilities=("WiFi", "AC")),
+        room("r3", "p1", 1200000, room_type="Deluxe", facilities=("WiFi", "AC", "Kamar mandi dalam")),
+        room("r4", "p2", 3500000, room_type="VIP", facilities=("AC",)),
+        room("r5", "p2", 800000, status="occupied"),
+        room("r6", "p3", 900000),
+    ])
+    return database
+
+
+def search(**params):
+    arguments = {
+        "status": "available", "min_price": None, "max_price": None, "room_type": None, "facilities": [],
+        "property_id": None, "sort": "price_asc", "page": 1, "limit": 20, "current_user": OWNER,
+    }
+    arguments.update(params)
+    return asyncio.run(server.search_rooms(**arguments))
+
+
+def item_ids(result):
+    return [item["id"] for item in result["items"]]
+
+
+def test_search_defaults_to_available_rooms_of_own_properties(db):
+    result = search()
+
+    assert item_ids(result) == ["r1", "r2", "r3", "r4"]
+    assert result["total"] == 4
+    assert all("_id" not in item for item in result["items"])
+
+
+def test_search_filters_combine(db):
+    assert item_ids(search(min_price=500000, max_price=2000000)) == ["r2", "r3"]
+    assert item_ids(search(room_type="Deluxe")) == ["r3"]
+    assert item_ids(search(facilities=["WiFi", "AC"])) == ["r2", "r3"]
+    assert item_ids(search(status=None, property_id="p2")) == ["r5", "r4"]
+
+
+def test_search_rejects_properties_of_other_owners(db):
+    with pytest.raises(HTTPException) as error:
+        search(property_id="p3")
+    assert error.value.status_code == 404
+
+
+def test_search_paginates_with_stable_order(db):
+    # Equal prices are ordered by id, so pages never overlap
+    first = search(sort="price_desc", limit=2)
+    second = search(sort="price_desc", limit=2, page=2)
+
+    assert item_ids(first) == ["r4", "r2"]
+    assert item_ids(second) == ["r3", "r1"]
+    assert first["total"] == second["total"] == 4
+
+
+def test_search_clamps_page_and_limit(db):
+    result = search(page=0, limit=500)
+
+    assert (result["page"], result["limit"]) == (1, 100)
+
+
+def test_search_facets_cover_the_whole_filtered_set(db):
+    facets = search(limit=1)["facets"]
+
+    assert facets["property"] == [
+        {"property_id": "p1", "name": "Kos Melati", "count": 3},
+        {"property_id": "p2", "name": "Kos Mawar", "count": 1},
+    ]
+    assert sorted((f["room_type"], f["count"]) for f in facets["room_type"]) == [("Deluxe", 1), ("Standard", 2), ("VIP", 1)]
+    assert facets["price"] == [
+        {"min": 0, "max": 500000, "count": 1},
+        {"min": 1000000, "max": 1500000, "count": 2},
+        {"min": 3000000, "max": None, "count": 1},
+    ]
+
+
+def test_price_facet_ignores_prices_below_the_first_bucket(db):
+    db.rooms.docs.append(room("r7", "p1", -100))
+
+    facets = search()["facets"]
+
+    assert {"min": 3000000, "max": None, "count": 1} in facets["price"]
+    assert sum(f["count"] for f in facets["price"]) == 4
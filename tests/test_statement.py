@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import server
+from tests.fake_motor import FakeDatabase
+
+JAKARTA = ZoneInfo("Asia/Jakarta")
+OWNER = {"id": "owner-1", "role": "owner"}
+START = datetime(2026, 3, 1, tzinfo=JAKARTA)
+END = datetime(2026, 4, 1, tzinfo=JAKARTA)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "BUSINESS_TIMEZONE", JAKARTA)
+    database.rooms.docs.append({"id": "r1", "property_id": "p1", "price": 1000})
+    database.tenants.docs.append({
+        "id": "t1",
+        "property_id": "p1",
+        "room_id": "r1",
+        "full_name": "Budi Santoso",
+        "check_in_date": "2026-01-10T03:00:00+00:00",
+        "check_out_date": None,
+    })
+    database.payments.docs.append({
+        "id": "pay-1", "tenant_id": "t1", "property_id": "p1", "amount": 1500,
+        "payment_date": "2026-02-05T02:00:00+00:00", "status": "approved", "notes": "Transfer",
+    })
+    database.canteen_transactions.docs.append({
+        "id": "sale-1", "tenant_id": "t1", "property_id": "p1", "total_price": 20,
+        "transaction_date": "2026-03-02T05:00:00+00:00", "notes": None,
+    })
+    database.utility_meters.docs.append({
+        "id": "meter-1", "room_id": "r1", "property_id": "p1", "meter_type": "listrik",
+        "total_cost": 50, "reading_date": "2026-03-03T05:00:00+00:00",
+    })
+    return database
+
+
+def statement(start=START, end=END):
+    return asyncio.run(server.get_tenant_statement("t1", start, end, OWNER))
+
+
+def test_rent_is_charged_per_local_billing_month():
+    tenant = {"room_id": "r1", "check_in_date": "2026-01-10T03:00:00+00:00"}
+
+    charges = server.rent_charges(tenant, 1000, END)
+
+    assert [(charge["date"], charge["description"]) for charge in charges] == [
+        ("2026-01-10T03:00:00+00:00", "Sewa 2026-01"),
+        ("2026-01-31T17:00:00+00:00", "Sewa 2026-02"),
+        ("2026-02-28T17:00:00+00:00", "Sewa 2026-03"),
+    ]
+
+
+def test_rent_stops_at_check_out():
+    tenant = {
+        "room_id": "r1",
+        "check_in_date": "2026-01-10T03:00:00+00:00",
+        "check_out_date": "2026-02-15T03:00:00+00:00",
+    }
+
+    assert len(server.rent_charges(tenant, 1000, END)) == 2
+
+
+def test_statement_includes_rent_and_opening_balance(db):
+    result = statement()
+
+    # January and February rent less the February payment
+    assert result["opening_balance"] == 500
+    assert [(entry["type"], entry["amount"]) for entry in result["entries"]] == [
+        ("rent", 1000), ("canteen", 20), ("utility", 50),
+    ]
+    assert result["closing_balance"] == 1570
+
+
+def test_closed_statement_is_cached_until_a_late_entry_lands(db):
+    assert statement()["closing_balance"] == 1570
+    assert len(db.statement_cache.docs) == 1
+
+    db.payments.docs.append({
+        "id": "pay-2", "tenant_id": "t1", "property_id": "p1", "amount": 300,
+        "payment_date": "2026-03-20T02:00:00+00:00", "status": "pending", "notes": None,
+    })
+    asyncio.run(server.approve_payment("pay-2", OWNER))
+
+    assert db.statement_cache.docs == []
+    assert statement()["closing_balance"] == 1270
+
+
+def test_utility_reading_invalidates_statements_of_room_tenants(db):
+    statement()
+    db.statement_cache.docs.append({"_id": "t2::", "tenant_id": "t2", "statement": {}})
+
+    asyncio.run(server.create_utility_meter(server.UtilityMeterCreate(
+        property_id="p1", room_id="r1", meter_type="air", previous_reading=10, current_reading=12,
+        cost_per_unit=5, reading_date=datetime(2026, 3, 25, tzinfo=timezone.utc),
+    ), OWNER))
+
+    assert [doc["tenant_id"] for doc in db.statement_cache.docs] == ["t2"]
+
+
+def test_rejecting_an_approved_payment_invalidates_statements(db):
+    statement()
+
+    asyncio.run(server.reject_payment("pay-1", OWNER))
+
+    assert db.statement_cache.docs == []
+    # January to March rent, canteen and utility, with the February payment gone
+    assert statement()["closing_balance"] == 3070
+
+
+def test_room_price_change_keeps_rent_of_earlier_months(db):
+    before = statement(end=None)
+
+    asyncio.run(server.update_room("r1", {"price": 2000}, OWNER))
+    after = statement(end=None)
+
+    rent_before = [entry["amount"] for entry in before["entries"] if entry["type"] == "rent"]
+    rent_after = [entry["amount"] for entry in after["entries"] if entry["type"] == "rent"]
+    assert rent_after == rent_before
+    assert [doc["price"] for doc in db.room_prices.docs] == [1000, 2000]
+
+
+def test_rent_uses_the_price_in_effect_on_each_charge():
+    tenant = {"room_id": "r1", "check_in_date": "2026-01-10T03:00:00+00:00"}
+    history = [
+        {"price": 1000, "effective_from": ""},
+        {"price": 1200, "effective_from": "2026-02-15T00:00:00+00:00"},
+    ]
+
+    charges = server.rent_charges(tenant, 1500, END, history)
+
+    assert [charge["amount"] for charge in charges] == [1000, 1000, 1200]